@@ -0,0 +1,114 @@
+import sys
+
+import numpy as np
+
+sys.path.insert(1, "../LLM_Analogical_Reasoning")
+
+from Code.grading_stats import score_stats
+
+
+class ScoreAccumulator:
+    """
+    Running per-question score statistics for any number of subjects (models or
+    human groups), kept as Welford state: the count, mean and sum of squared
+    deviations of the scores seen so far for every (subject, question index) cell,
+    where question indices follow the answer key (quiz by quiz, condition by
+    condition). Scores can be added one at a time or in batches, accumulators from
+    different workers can be merged, and score_stats dictionaries are available at
+    any point.
+    """
+
+    def __init__(self):
+        self.cells: dict[tuple[str, int], list[float]] = {}
+
+    def add(self, subject: str, question_index: int, score: float):
+        """
+        Adds one graded sample.
+        """
+        cell = self.cells.setdefault((subject, int(question_index)), [0, 0.0, 0.0])
+        cell[0] += 1
+        delta = score - cell[1]
+        cell[1] += delta / cell[0]
+        cell[2] += delta * (score - cell[1])
+
+    def _combine(self, key: tuple[str, int], count: int, mean: float, m2: float):
+        """
+        Folds the state of another set of scores for the same cell into key.
+        """
+        cell = self.cells.setdefault(key, [0, 0.0, 0.0])
+        total = cell[0] + count
+        delta = mean - cell[1]
+        cell[2] += m2 + delta * delta * cell[0] * count / total
+        cell[1] += delta * count / total
+        cell[0] = total
+
+    def add_many(self, subject: str, question_indices, scores):
+        """
+        Adds a batch of graded samples, e.g. all samples of a model's transcript.
+        """
+        question_indices = np.asarray(question_indices, dtype=int)
+        scores = np.asarray(scores, dtype=float)
+        cells, codes = np.unique(question_indices, return_inverse=True)
+        counts = np.bincount(codes)
+        means = np.bincount(codes, weights=scores) / counts
+        m2s = np.bincount(codes, weights=(scores - means[codes]) ** 2)
+        for cell, count, mean, m2 in zip(cells.tolist(), counts, means, m2s):
+            self._combine((subject, cell), int(count), float(mean), float(m2))
+
+    def merge(self, other: "ScoreAccumulator") -> "ScoreAccumulator":
+        """
+        Folds the scores of other (e.g. from another worker) into this accumulator
+        and returns it.
+        """
+        for key, (count, mean, m2) in other.cells.items():
+            self._combine(key, count, mean, m2)
+        return self
+
+    @property
+    def subjects(self) -> list[str]:
+        return list(dict.fromkeys(subject for subject, _ in self.cells))
+
+    def question_scores(
+        self, subject: str, num_questions: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the average score, standard deviation and standard error of the
+        scores of subject for each of num_questions questions, as model_stats
+        computes them. Questions without scores yet are nan.
+        """
+        counts = np.zeros(num_questions)
+        means = np.full(num_questions, np.nan)
+        m2s = np.full(num_questions, np.nan)
+        for (cell_subject, question_index), cell in self.cells.items():
+            if cell_subject == subject and question_index < num_questions:
+                counts[question_index], means[question_index], m2s[question_index] = (
+                    cell
+                )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            stds = np.sqrt(m2s / counts)
+            stderrs = stds / np.sqrt(counts)
+        return means, stds, stderrs
+
+    def stats(
+        self,
+        subject: str,
+        experiment_conditions: list[str],
+        questions_per_quiz: int,
+        num_questions: int,
+        condition_schema: dict[str, tuple[int, int]] | None = None,
+    ) -> tuple[dict[str, list[float]], dict[str, list[list[float]]]]:
+        """
+        Returns the condition_stats and question_stats of score_stats for subject
+        from the scores seen so far. Stats that depend on questions without scores
+        yet are nan.
+        """
+        means, stds, stderrs = self.question_scores(subject, num_questions)
+        return score_stats(
+            means.tolist(),
+            stds.tolist(),
+            stderrs.tolist(),
+            experiment_conditions,
+            questions_per_quiz,
+            model_name=subject,
+            condition_schema=condition_schema,
+        )
@@ -0,0 +1,332 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from typing import Callable
+
+import numpy as np
+
+sys.path.insert(1, "../LLM_Analogical_Reasoning")
+
+import Code.grading_stats as grading_stats
+from Code.grading_cache import GradingCache
+from Code.transcripts import CACHE_SUFFIX
+
+# answer key entries from the pilot and followup, all with pilot contexts
+ANSWER_KEY = [
+    answer
+    for condition in grading_stats.PILOT_ANSWERS + grading_stats.FOLLOWUP_ANSWERS
+    for answer in condition
+]
+
+# confusion pairs, the first n of which are used when grading with n pairs
+CONFUSION_PAIRS = [("|", "I"), ("L", "I"), ("0", "O"), ("1", "I")]
+
+FILLER = [
+    "The pattern continues with the next item in the sequence.",
+    "Question 5:",
+    "dog => C C C",
+    "I think the answer is the one above, but it could also be",
+    "",
+]
+
+RESPONSE_KINDS = [
+    "correct",
+    "confused",
+    "lower_case",
+    "scrambled",
+    "copy_context",
+    "rambling",
+    "prompted",
+    "other",
+]
+RESPONSE_KIND_WEIGHTS = [0.35, 0.1, 0.05, 0.15, 0.1, 0.1, 0.05, 0.1]
+
+
+def synthetic_response(
+    rng: np.random.Generator, kind: str, answer: tuple[str, str | None, bool]
+) -> str:
+    """
+    Returns a response of the given kind to a question with the given answer key
+    entry, in the style of the model transcripts.
+    """
+    text, prompt, _ = answer
+    if kind == "confused":
+        return text.replace("I", "|")
+    if kind == "lower_case":
+        return text.lower()
+    if kind == "scrambled":
+        return " ".join(rng.permutation(text.split()))
+    if kind == "copy_context":
+        groundings = grading_stats.PILOT_CONTEXTS[text].groundings
+        return groundings[rng.integers(len(groundings))]
+    if kind == "rambling":
+        lines = rng.choice(FILLER, size=rng.integers(20, 200)).tolist()
+        return "\n".join([text, *lines])
+    if kind == "prompted":
+        return (prompt or "") + text
+    if kind == "other":
+        return " ".join(rng.choice(list("ABXY%*^"), size=rng.integers(1, 8)))
+    return text
+
+
+def synthetic_corpus(
+    rows: int, seed: int = 0
+) -> tuple[list[str], list[tuple[str, str | None, bool]]]:
+    """
+    Returns rows synthetic responses and the answer key entry each responds to.
+    """
+    rng = np.random.default_rng(seed)
+    answers = [ANSWER_KEY[i] for i in rng.integers(len(ANSWER_KEY), size=rows)]
+    kinds = rng.choice(RESPONSE_KINDS, size=rows, p=RESPONSE_KIND_WEIGHTS)
+    responses = [
+        synthetic_response(rng, kind, answer) for kind, answer in zip(kinds, answers)
+    ]
+    return responses, answers
+
+
+def synthetic_transcript(
+    path: str, responses: list[str], questions_per_quiz: int, samples_per_q: int
+):
+    """
+    Writes responses to path as a model transcript, samples_per_q per question.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(0, len(responses), samples_per_q):
+            question = (i // samples_per_q) % questions_per_quiz + 1
+            f.write(
+                f"About to prompt model ({samples_per_q} times) with:\n\n"
+                f"Question {question}:\nx => \n\n"
+                "--------- SAMPLED RESPONSE SET ---------\n"
+            )
+            for response in responses[i : i + samples_per_q]:
+                f.write(f"{response}\n{'-' * 40}\n")
+            f.write("\n")
+
+
+def measure(run: Callable[[], object], memory: bool = True) -> dict[str, float]:
+    """
+    Times run and, if memory, runs it again under tracemalloc to find the peak
+    memory it allocates (the timed run is not traced, since tracing slows
+    allocation-heavy code down).
+    """
+    start = time.perf_counter()
+    run()
+    result = {"seconds": time.perf_counter() - start}
+    if memory:
+        tracemalloc.start()
+        run()
+        result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def benchmark_cases(
+    responses: list[str],
+    answers: list[tuple[str, str | None, bool]],
+    pair_counts: list[int],
+    directory: str,
+    benchmarks: list[str] | None = None,
+):
+    """
+    Yields (benchmark, parameters, function) for every benchmark on the corpus,
+    or for those named in benchmarks.
+    """
+    texts = [answer[0] for answer in answers]
+    prompts = [answer[1] for answer in answers]
+    case_sensitive = [answer[2] for answer in answers]
+    answer_key = list(dict.fromkeys(answers))
+    key_indices = {answer: i for i, answer in enumerate(answer_key)}
+    answer_indices = [key_indices[answer] for answer in answers]
+    cache_path = os.path.join(directory, "grading_cache.sqlite")
+
+    def grade_each(grade, pairs, first_and_last):
+        return [
+            grade(
+                response,
+                answer[0],
+                pairs,
+                prompt=answer[1],
+                case_sensitive=answer[2],
+                first_and_last=first_and_last,
+            )
+            for response, answer in zip(responses, answers)
+        ]
+
+    def grade_batch(pairs, first_and_last, confusable):
+        return grading_stats.grade_batch(
+            responses,
+            texts,
+            prompts,
+            case_sensitive,
+            first_and_last=first_and_last,
+            pairs=pairs,
+            confusable=confusable,
+        )
+
+    def grade_corpus(pairs, first_and_last, cache=None):
+        return grading_stats.ResponseCorpus(
+            answer_key, pairs, first_and_last, cache=cache
+        ).grade(responses, answer_indices)
+
+    def grade_cached(pairs, first_and_last, cold):
+        if cold and os.path.exists(cache_path):
+            os.remove(cache_path)
+        cache = GradingCache(cache_path)
+        try:
+            grade_corpus(pairs, first_and_last, cache)
+        finally:
+            cache.close()
+
+    # the settings of every case are bound when it is yielded, so it can be run
+    # at any time
+    for num_pairs in pair_counts:
+        pairs = CONFUSION_PAIRS[:num_pairs]
+        for first_and_last in [False, True]:
+            parameters = {"pairs": num_pairs, "first_and_last": first_and_last}
+            for name, grade in [
+                ("grade_charitably", grading_stats.grade_charitably),
+                ("grade_confusable", grading_stats.grade_confusable),
+            ]:
+                yield name, parameters, partial(
+                    grade_each, grade, pairs, first_and_last
+                )
+            for confusable in [False, True]:
+                yield "grade_batch", parameters | {"confusable": confusable}, partial(
+                    grade_batch, pairs, first_and_last, confusable
+                )
+            yield "response_corpus", parameters, partial(
+                grade_corpus, pairs, first_and_last
+            )
+            if benchmarks and "grading_cache" not in benchmarks:
+                continue
+            yield "grading_cache", parameters | {"cache": "cold"}, partial(
+                grade_cached, pairs, first_and_last, True
+            )
+            # filled here, so the warm case does not depend on the cold one
+            # having been run
+            grade_cached(pairs, first_and_last, True)
+            yield "grading_cache", parameters | {"cache": "warm"}, partial(
+                grade_cached, pairs, first_and_last, False
+            )
+    yield "get_failure_mode", {}, lambda: [
+        grading_stats.get_failure_mode(response, text)
+        for response, text in zip(responses, texts)
+    ]
+    yield "indel_ratio", {}, lambda: [
+        grading_stats.indel_ratio(response, text)
+        for response, text in zip(responses, texts)
+    ]
+
+    # model_stats grades whole quizzes of 4 questions with 5 samples each
+    samples = 4 * 5
+    num_quizzes = len(responses) // samples
+    if num_quizzes and (not benchmarks or "model_stats" in benchmarks):
+        path = os.path.join(directory, "synthetic_results.txt")
+        synthetic_transcript(path, responses[: num_quizzes * samples], 4, 5)
+        model_answer_key = [answers[i] for i in range(0, num_quizzes * samples, 5)]
+
+        def run_model_stats(first_and_last):
+            # every run parses the transcript rather than reading its cache
+            if os.path.exists(path + CACHE_SUFFIX):
+                os.remove(path + CACHE_SUFFIX)
+            grading_stats.model_stats(
+                [path],
+                model_answer_key,
+                ["defaults"],
+                num_quizzes,
+                4,
+                5,
+                "synthetic",
+                first_and_last=first_and_last,
+                condition_schema={"defaults": (num_quizzes, 4)},
+            )
+
+        for first_and_last in [False, True]:
+            yield "model_stats", {"first_and_last": first_and_last}, partial(
+                run_model_stats, first_and_last
+            )
+
+
+def run_benchmarks(
+    sizes: list[int],
+    pair_counts: list[int] = [0, 1, 2],
+    benchmarks: list[str] | None = None,
+    memory: bool = True,
+    seed: int = 0,
+    verbose: bool = False,
+) -> list[dict]:
+    """
+    Runs every benchmark (or those named in benchmarks) on a synthetic corpus of
+    each size and returns one record per run with its rows per second and peak
+    memory, printing each record as JSON as it finishes if verbose.
+    """
+    records = []
+    for rows in sizes:
+        responses, answers = synthetic_corpus(rows, seed)
+        with tempfile.TemporaryDirectory() as directory:
+            for name, parameters, run in benchmark_cases(
+                responses, answers, pair_counts, directory, benchmarks
+            ):
+                if benchmarks and name not in benchmarks:
+                    continue
+                # model_stats only grades whole quizzes
+                graded = rows - rows % 20 if name == "model_stats" else rows
+                result = measure(run, memory)
+                records.append(
+                    {
+                        "benchmark": name,
+                        "rows": graded,
+                        **parameters,
+                        **result,
+                        "rows_per_second": graded / result["seconds"],
+                    }
+                )
+                if verbose:
+                    print(json.dumps(records[-1]), flush=True)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measures grading throughput on synthetic responses."
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000]
+    )
+    parser.add_argument("--pairs", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--benchmarks", nargs="+")
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    records = run_benchmarks(
+        args.sizes,
+        args.pairs,
+        args.benchmarks,
+        not args.no_memory,
+        args.seed,
+        verbose=True,
+    )
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+                "seed": args.seed,
+                "results": records,
+            },
+            f,
+            indent=2,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+import scipy.special
+
+
+def _z(confidence: float) -> float:
+    return float(scipy.special.ndtri(1 - (1 - confidence) / 2))
+
+
+def wilson_interval(
+    successes, trials, confidence: float = 0.95
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the lower and upper bounds of the Wilson score interval for every
+    pair of successes and trials (nan where there are no trials).
+    """
+    successes = np.asarray(successes, dtype=float)
+    trials = np.asarray(trials, dtype=float)
+    z2 = _z(confidence) ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        center = (successes + z2 / 2) / (trials + z2)
+        half_width = (
+            np.sqrt(z2)
+            / (trials + z2)
+            * np.sqrt(successes * (trials - successes) / trials + z2 / 4)
+        )
+    no_trials = trials == 0
+    return (
+        np.where(no_trials, np.nan, np.maximum(center - half_width, 0)),
+        np.where(no_trials, np.nan, np.minimum(center + half_width, 1)),
+    )
+
+
+def _beta_interval(
+    successes: np.ndarray,
+    trials: np.ndarray,
+    confidence: float,
+    lower_shape: tuple[np.ndarray, np.ndarray],
+    upper_shape: tuple[np.ndarray, np.ndarray],
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the (1 - confidence) / 2 quantile of a beta distribution with
+    lower_shape parameters and the 1 - (1 - confidence) / 2 quantile of one with
+    upper_shape parameters, pinned to 0 without successes and to 1 without
+    failures.
+    """
+    alpha = (1 - confidence) / 2
+    with np.errstate(invalid="ignore"):
+        lower = scipy.special.betaincinv(*lower_shape, alpha)
+        upper = scipy.special.betaincinv(*upper_shape, 1 - alpha)
+    lower = np.where(successes == 0, 0.0, lower)
+    upper = np.where(successes == trials, 1.0, upper)
+    no_trials = trials == 0
+    return np.where(no_trials, np.nan, lower), np.where(no_trials, np.nan, upper)
+
+
+def clopper_pearson_interval(
+    successes, trials, confidence: float = 0.95
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the lower and upper bounds of the exact Clopper-Pearson interval for
+    every pair of successes and trials (nan where there are no trials).
+    """
+    successes = np.asarray(successes, dtype=float)
+    trials = np.asarray(trials, dtype=float)
+    failures = trials - successes
+    return _beta_interval(
+        successes,
+        trials,
+        confidence,
+        (successes, failures + 1),
+        (successes + 1, failures),
+    )
+
+
+def jeffreys_interval(
+    successes, trials, confidence: float = 0.95
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the lower and upper bounds of the equal-tailed Jeffreys interval, the
+    quantiles of the Beta(successes + 1/2, failures + 1/2) posterior, for every
+    pair of successes and trials (nan where there are no trials).
+    """
+    successes = np.asarray(successes, dtype=float)
+    trials = np.asarray(trials, dtype=float)
+    shape = (successes + 0.5, trials - successes + 0.5)
+    return _beta_interval(successes, trials, confidence, shape, shape)
+
+
+BINOMIAL_INTERVALS = {
+    "wilson": wilson_interval,
+    "clopper_pearson": clopper_pearson_interval,
+    "jeffreys": jeffreys_interval,
+}
+
+
+def binomial_interval(
+    successes, trials, method: str = "wilson", confidence: float = 0.95
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the lower and upper bounds of the interval named by method (a key of
+    BINOMIAL_INTERVALS) for every pair of successes and trials.
+    """
+    if method not in BINOMIAL_INTERVALS:
+        raise ValueError(f"Unknown binomial interval method {method}.")
+    return BINOMIAL_INTERVALS[method](successes, trials, confidence)
+
+
+def cell_intervals(
+    df: pd.DataFrame,
+    by: list[str],
+    value: str = "respondent_scores",
+    method: str = "wilson",
+    confidence: float = 0.95,
+) -> pd.DataFrame:
+    """
+    Returns the successes, trials, accuracy and interval bounds of the 0/1 scores
+    in the value column of df for every group of the by columns, e.g.
+    ["subject_type", "quiz_number", "question_num"] for every question cell.
+    """
+    cells = (
+        df.groupby(by, observed=True)[value]
+        .agg(successes="sum", trials="count")
+        .reset_index()
+    )
+    cells["accuracy"] = cells["successes"] / cells["trials"]
+    cells["low"], cells["high"] = binomial_interval(
+        cells["successes"].to_numpy(), cells["trials"].to_numpy(), method, confidence
+    )
+    return cells
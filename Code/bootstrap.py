@@ -0,0 +1,207 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.special
+
+
+def _factorize(groups) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns integer codes for groups and the sorted group labels.
+    """
+    if not isinstance(groups, pd.Index):
+        groups = np.asarray(groups)
+    codes, labels = pd.factorize(groups, sort=True)
+    return codes, np.asarray(labels)
+
+
+def _resample_chunk(
+    values: np.ndarray,
+    starts: np.ndarray,
+    counts: np.ndarray,
+    num_resamples: int,
+    seed: np.random.SeedSequence,
+) -> np.ndarray:
+    """
+    Returns the group means of num_resamples resamples of values, which are sorted
+    by group, with group g occupying values[starts[g] : starts[g] + counts[g]].
+    Every group is resampled with replacement within itself.
+    """
+    rng = np.random.default_rng(seed)
+    position_starts = np.repeat(starts, counts)
+    position_counts = np.repeat(counts, counts)
+    # scaling uniform floats is about twice as fast as integers() with per-position
+    # bounds
+    indices = (rng.random((num_resamples, len(values))) * position_counts).astype(
+        np.int64
+    )
+    indices += position_starts
+    return np.add.reduceat(values[indices], starts, axis=1) / counts
+
+
+def bootstrap_means(
+    values: np.ndarray,
+    groups: np.ndarray,
+    num_resamples: int = 10_000,
+    seed: int | None = None,
+    max_elements: int = 1 << 22,
+    max_workers: int | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Resamples values with replacement within each of their groups and returns the
+    group labels, the observed group means and a (num_resamples, groups) array of
+    resampled group means. Resamples are drawn in chunks of at most max_elements
+    indices, spread over a process pool if max_workers is given. The results only
+    depend on seed, not on max_workers.
+    """
+    values = np.asarray(values, dtype=float)
+    codes, labels = _factorize(groups)
+    order = np.argsort(codes, kind="stable")
+    values, codes = values[order], codes[order]
+    counts = np.bincount(codes, minlength=len(labels))
+    starts = np.cumsum(counts) - counts
+    estimates = np.add.reduceat(values, starts) / counts
+
+    rows_per_chunk = max(1, max_elements // max(1, len(values)))
+    chunk_sizes = [
+        min(rows_per_chunk, num_resamples - i)
+        for i in range(0, num_resamples, rows_per_chunk)
+    ]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    arguments = (
+        [values] * len(chunk_sizes),
+        [starts] * len(chunk_sizes),
+        [counts] * len(chunk_sizes),
+        chunk_sizes,
+        seeds,
+    )
+    if max_workers is None or max_workers <= 1 or len(chunk_sizes) == 1:
+        chunks = list(map(_resample_chunk, *arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            chunks = list(executor.map(_resample_chunk, *arguments))
+    return labels, estimates, np.concatenate(chunks)
+
+
+def jackknife_acceleration(values: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    """
+    Returns the BCa acceleration of the mean of every group (in sorted group
+    order), estimated from the leave-one-out means. Groups with fewer than two
+    values, or no spread, get an acceleration of 0.
+    """
+    values = np.asarray(values, dtype=float)
+    codes, labels = _factorize(groups)
+    counts = np.bincount(codes, minlength=len(labels))
+    sums = np.bincount(codes, weights=values, minlength=len(labels))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # the mean of the leave-one-out means is the group mean, so each deviation
+        # from it is (value - mean) / (count - 1)
+        deviations = (values - (sums / counts)[codes]) / (counts - 1)[codes]
+        numerator = np.bincount(codes, weights=deviations**3, minlength=len(labels))
+        denominator = np.bincount(codes, weights=deviations**2, minlength=len(labels))
+        acceleration = numerator / (6 * denominator**1.5)
+    return np.nan_to_num(acceleration, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def _quantiles(sorted_resamples: np.ndarray, levels: np.ndarray) -> np.ndarray:
+    """
+    Returns the levels[g] quantile of column g of sorted_resamples, interpolated
+    linearly like np.quantile.
+    """
+    positions = np.clip(levels, 0, 1) * (len(sorted_resamples) - 1)
+    below = np.floor(positions).astype(int)
+    above = np.minimum(below + 1, len(sorted_resamples) - 1)
+    columns = np.arange(sorted_resamples.shape[1])
+    fraction = positions - below
+    return (
+        sorted_resamples[below, columns] * (1 - fraction)
+        + sorted_resamples[above, columns] * fraction
+    )
+
+
+def bootstrap_intervals(
+    values: np.ndarray,
+    groups: np.ndarray,
+    num_resamples: int = 10_000,
+    confidence: float = 0.95,
+    method: str = "bca",
+    seed: int | None = None,
+    max_elements: int = 1 << 22,
+    max_workers: int | None = None,
+) -> dict[str, np.ndarray]:
+    """
+    Returns bootstrap confidence intervals for the mean of every group of values,
+    e.g. respondent accuracies grouped by condition, or sample grades grouped by
+    (model, condition). The result holds the sorted group labels ("groups"), the
+    observed means ("estimate") and the interval bounds ("low", "high"). method is
+    "percentile" or "bca" (bias-corrected and accelerated).
+    """
+    if method not in ("percentile", "bca"):
+        raise ValueError(f"Unknown bootstrap interval method {method}.")
+    labels, estimates, resamples = bootstrap_means(
+        values, groups, num_resamples, seed, max_elements, max_workers
+    )
+    alpha = (1 - confidence) / 2
+    levels = np.array([[alpha], [1 - alpha]]).repeat(len(labels), axis=1)
+
+    if method == "bca":
+        # ties count half, so that groups without spread get no bias correction
+        below = (resamples < estimates).sum(axis=0)
+        ties = (resamples == estimates).sum(axis=0)
+        proportion = np.clip(
+            (below + ties / 2) / num_resamples,
+            0.5 / num_resamples,
+            1 - 0.5 / num_resamples,
+        )
+        bias = scipy.special.ndtri(proportion)
+        acceleration = jackknife_acceleration(values, groups)
+        z = scipy.special.ndtri(levels)
+        levels = scipy.special.ndtr(bias + (bias + z) / (1 - acceleration * (bias + z)))
+
+    resamples.sort(axis=0)
+    return {
+        "groups": labels,
+        "estimate": estimates,
+        "low": _quantiles(resamples, levels[0]),
+        "high": _quantiles(resamples, levels[1]),
+    }
+
+
+def frame_intervals(
+    df: pd.DataFrame,
+    by: list[str],
+    value: str = "respondent_scores",
+    unit: list[str] | None = None,
+    **kwargs,
+) -> pd.DataFrame:
+    """
+    Returns a frame of bootstrap_intervals for the mean of the value column of df
+    in every group of the by columns (e.g. ["subject_type", "quiz_class"]). If unit
+    columns are given (e.g. a respondent id), values are first averaged per unit so
+    that whole units are resampled. Keyword arguments go to bootstrap_intervals.
+    """
+    if unit:
+        df = (
+            df.groupby(by + unit, observed=True, sort=False)[value].mean().reset_index()
+        )
+    keys = pd.MultiIndex.from_frame(df[by])
+    intervals = bootstrap_intervals(df[value].to_numpy(), keys, **kwargs)
+    result = pd.DataFrame(
+        {k: intervals[k] for k in ("estimate", "low", "high")},
+        index=pd.MultiIndex.from_tuples(intervals["groups"], names=by),
+    )
+    return result.reset_index()
+
+
+def error_bars(
+    estimate: np.ndarray, low: np.ndarray, high: np.ndarray
+) -> list[list[float]]:
+    """
+    Returns [distances below, distances above] the estimates, the asymmetric yerr
+    form accepted by plotting.comparison_bar_plot.
+    """
+    estimate = np.asarray(estimate)
+    return [
+        np.maximum(estimate - low, 0).tolist(),
+        np.maximum(high - estimate, 0).tolist(),
+    ]
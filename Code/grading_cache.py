@@ -0,0 +1,255 @@
+import hashlib
+import inspect
+import json
+import sqlite3
+import sys
+
+sys.path.insert(1, "../LLM_Analogical_Reasoning")
+
+import Code.grading_stats as grading_stats
+from Code.quiz_generation import GROUNDINGS
+
+
+def grader_version() -> str:
+    """
+    Returns a hash of the source of the whole grading_stats module and of the
+    groundings used for failure modes, so that any change to the grader logic
+    (including the helpers it normalizes answers with) produces a new version
+    and invalidates cached results.
+    """
+    source = inspect.getsource(grading_stats)
+    source += json.dumps(GROUNDINGS.tolist())
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+
+
+GRADER_VERSION = grader_version()
+
+
+class GradingCache:
+    """
+    A persistent sqlite store of grading and failure mode results, keyed by the
+    response hash, the answer, the grading options and the grader version.
+    Entries from other grader versions are dropped on open, and the least
+    recently used entries are evicted once there are more than max_entries.
+    If deferred, the store is only read: new entries and hits are kept in
+    pending and touched until a cache that writes stores them with
+    write_pending, as model_stats_parallel does for its workers.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 1_000_000,
+        version: str = GRADER_VERSION,
+        deferred: bool = False,
+        timeout: float = 60.0,
+    ):
+        self.max_entries = max_entries
+        self.version = version
+        self.deferred = deferred
+        self.prefixes: dict[tuple, bytes] = {}
+        self.pending: dict[str, int] = {}
+        self.touched: set[str] = set()
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        # readers in other processes do not block on a writer
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results "
+            "(key TEXT PRIMARY KEY, version TEXT, value INTEGER, last_used INTEGER)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)"
+        )
+        if not deferred:
+            self.connection.execute(
+                "DELETE FROM results WHERE version != ?", (version,)
+            )
+        self.connection.commit()
+        self.clock, self.size = self.connection.execute(
+            "SELECT COALESCE(MAX(last_used), 0), COUNT(*) FROM results"
+        ).fetchone()
+
+    def key(
+        self,
+        kind: str,
+        response: str,
+        answer: str | frozenset[str],
+        prompt: str | None = None,
+        case_sensitive: bool = False,
+        pairs: list[tuple[str, str]] | None = None,
+        first_and_last: bool = False,
+        context: list[str] | None = None,
+    ) -> str:
+        """
+        Returns the cache key of one grading request. The options shared by
+        many requests are encoded once per distinct combination.
+        """
+        options = (
+            kind,
+            tuple(sorted(answer)) if isinstance(answer, (set, frozenset)) else answer,
+            prompt,
+            bool(case_sensitive),
+            tuple(map(tuple, pairs or [])),
+            bool(first_and_last),
+            tuple(sorted(context)) if context is not None else None,
+        )
+        prefix = self.prefixes.get(options)
+        if prefix is None:
+            prefix = json.dumps([self.version, *options]).encode("utf-8") + b"\0"
+            self.prefixes[options] = prefix
+        return hashlib.sha256(prefix + response.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: list[str]) -> list[int | None]:
+        """
+        Returns the cached value of every key (None for misses) and marks the
+        hits as recently used.
+        """
+        found: dict[str, int] = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i : i + 500]
+            found.update(
+                self.connection.execute(
+                    "SELECT key, value FROM results WHERE key IN "
+                    f"({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+            )
+        if self.deferred:
+            self.touched.update(found)
+            found |= {k: self.pending[k] for k in keys if k in self.pending}
+        elif found:
+            self._touch(list(found))
+            self.connection.commit()
+        return [found.get(k) for k in keys]
+
+    def put_many(self, keys: list[str], values: list[int]):
+        """
+        Stores the values for the keys in one transaction (or in pending, if
+        deferred).
+        """
+        if self.deferred:
+            self.pending.update(zip(keys, map(int, values)))
+            return
+        self._insert(keys, values)
+        self.connection.commit()
+
+    def write_pending(self, pending: dict[str, int], touched):
+        """
+        Stores the pending entries and marks the touched keys of deferred
+        caches as recently used, in one transaction.
+        """
+        self._touch(list(touched))
+        self._insert(list(pending), list(pending.values()))
+        self.connection.commit()
+
+    def _touch(self, keys: list[str]):
+        self.clock += 1
+        for i in range(0, len(keys), 500):
+            chunk = keys[i : i + 500]
+            self.connection.execute(
+                "UPDATE results SET last_used = ? WHERE key IN "
+                f"({','.join('?' * len(chunk))})",
+                [self.clock, *chunk],
+            )
+
+    def _insert(self, keys: list[str], values: list[int]):
+        """
+        Inserts the values for the keys and evicts the least recently used
+        entries if the store has grown past max_entries. Keys already stored
+        keep their value, which the same grader version always computes the
+        same way.
+        """
+        self.clock += 1
+        inserted = self.connection.executemany(
+            "INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?)",
+            [(k, self.version, int(v), self.clock) for k, v in zip(keys, values)],
+        ).rowcount
+        self.size += max(inserted, 0)
+        if self.size > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM results WHERE key IN "
+                "(SELECT key FROM results ORDER BY last_used LIMIT ?)",
+                (self.size - self.max_entries,),
+            )
+            self.size = self.max_entries
+
+    def grade_charitably(
+        self,
+        response: str,
+        answer: str,
+        pairs: list[tuple[str, str]],
+        prompt: str | None = None,
+        case_sensitive: bool = False,
+        first_and_last: bool = False,
+    ) -> bool:
+        """
+        grading_stats.grade_charitably, answered from the cache when possible.
+        """
+        key = self.key(
+            "grade", response, answer, prompt, case_sensitive, pairs, first_and_last
+        )
+        (value,) = self.get_many([key])
+        if value is None:
+            value = int(
+                grading_stats.grade_charitably(
+                    response,
+                    answer,
+                    pairs,
+                    prompt=prompt,
+                    case_sensitive=case_sensitive,
+                    first_and_last=first_and_last,
+                )
+            )
+            self.put_many([key], [value])
+        return bool(value)
+
+    def get_failure_modes(
+        self,
+        responses: list["str | grading_stats.NormalizedResponse"],
+        answers: list[str],
+        contexts: list["grading_stats.GroundingContext | None"] | None = None,
+    ) -> list[grading_stats.FailureMode]:
+        """
+        grading_stats.get_failure_mode for many incorrect responses at once,
+        looking them all up with one query and storing the misses in one
+        transaction.
+        """
+        if contexts is None:
+            contexts = [None] * len(responses)
+        keys = [
+            self.key(
+                "failure_mode",
+                str(response),
+                answer,
+                context=context.groundings if context is not None else None,
+            )
+            for response, answer, context in zip(responses, answers, contexts)
+        ]
+        values = self.get_many(keys)
+        missing: dict[str, int] = {}
+        for i, (key, value) in enumerate(zip(keys, values)):
+            if value is None:
+                if key not in missing:
+                    missing[key] = grading_stats.get_failure_mode(
+                        responses[i], answers[i], contexts[i]
+                    ).value
+                values[i] = missing[key]
+        if missing:
+            self.put_many(list(missing), list(missing.values()))
+        return [grading_stats.FailureMode(value) for value in values]
+
+    def get_failure_mode(
+        self,
+        response: str | grading_stats.NormalizedResponse,
+        answer: str,
+        context: grading_stats.GroundingContext | None = None,
+    ) -> grading_stats.FailureMode:
+        """
+        grading_stats.get_failure_mode, answered from the cache when possible.
+        """
+        (failure_mode,) = self.get_failure_modes([response], [answer], [context])
+        return failure_mode
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
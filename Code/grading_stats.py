@@ -1,16 +1,20 @@
-import ast
+import csv
+import os
 import sys
+import warnings
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
+from functools import lru_cache
 from typing import Callable
 
 import numpy as np
 import pandas as pd
-import scipy.stats
 from Levenshtein import ratio
 
 sys.path.insert(1, "../LLM_Analogical_Reasoning")
 
 from Code.quiz_generation import GROUNDINGS, SEPARATOR
+from Code.transcripts import read_responses
 
 
 class FailureMode(Enum):
@@ -20,50 +24,259 @@ class FailureMode(Enum):
     OTHER = 3
 
 
+def first_contentful_line(response: str) -> str:
+    """
+    Returns the first non-empty line of the response, treating SEPARATOR as a
+    line break, or "" if there is none. Lines are found by searching forward from
+    the start, so only the text up to the end of that line is looked at.
+    """
+    line_start = 0
+    while line_start <= len(response):
+        line_end = response.find("\n", line_start)
+        if line_end == -1:
+            line_end = len(response)
+        # separators never contain a newline, so each line splits on its own
+        start = line_start
+        while True:
+            separator = response.find(SEPARATOR, start, line_end)
+            end = line_end if separator == -1 else separator
+            if end > start:
+                return response[start:end]
+            if separator == -1:
+                break
+            start = separator + len(SEPARATOR)
+        line_start = line_end + 1
+    return ""
+
+
+def last_contentful_line(response: str) -> str:
+    """
+    Returns the last non-empty line of the response, treating SEPARATOR as a
+    line break, or "" if there is none. Lines are found by searching backward
+    from the end.
+    """
+    line_end = len(response)
+    while line_end >= 0:
+        line_start = response.rfind("\n", 0, line_end) + 1
+        # split forward within the line, so overlapping separators are matched
+        # the same way as by str.replace
+        for piece in reversed(response[line_start:line_end].split(SEPARATOR)):
+            if piece:
+                return piece
+        line_end = line_start - 1
+    return ""
+
+
 def extract_content(response: str) -> str:
     """
     Extracts and returns the first contentful line in the response.
     """
-    extracted_list = [s for s in response.replace(SEPARATOR, "\n").split("\n") if s]
-    return extracted_list[0] if extracted_list else ""
+    return first_contentful_line(response)
 
 
 def extract_content_fl(response: str) -> list[str]:
     """
     Extracts and returns the first and last contentful lines in the response.
     """
-    extracted_list = [s for s in response.replace(SEPARATOR, "\n").split("\n") if s]
-    return [extracted_list[0], extracted_list[-1]] if extracted_list else []
+    first = first_contentful_line(response)
+    return [first, last_contentful_line(response)] if first else []
 
 
-def is_correct(response: str, answer: str) -> bool:
+class NormalizedResponse:
+    """
+    A response together with the normalized forms the grading predicates compare:
+    its first contentful line, that line without whitespace, the sorted characters
+    of that (the multiset) and their set. Each form is computed on first use and
+    then kept, so a response passed to several predicates is normalized once.
+    """
+
+    __slots__ = ("text", "_content", "_compact", "_multiset", "_characters")
+
+    def __init__(self, text: str):
+        self.text = text
+        self._content: str | None = None
+        self._compact: str | None = None
+        self._multiset: str | None = None
+        self._characters: frozenset[str] | None = None
+
+    def __str__(self) -> str:
+        return self.text
+
+    @property
+    def content(self) -> str:
+        if self._content is None:
+            self._content = extract_content(self.text)
+        return self._content
+
+    @property
+    def compact(self) -> str:
+        if self._compact is None:
+            self._compact = "".join(self.content.split())
+        return self._compact
+
+    @property
+    def multiset(self) -> str:
+        if self._multiset is None:
+            self._multiset = "".join(sorted(self.compact))
+        return self._multiset
+
+    @property
+    def characters(self) -> frozenset[str]:
+        if self._characters is None:
+            self._characters = frozenset(self.compact)
+        return self._characters
+
+
+def normalize(response: "str | NormalizedResponse") -> NormalizedResponse:
+    """
+    Returns response as a NormalizedResponse, reusing it if it already is one.
+    """
+    if isinstance(response, NormalizedResponse):
+        return response
+    return NormalizedResponse(response)
+
+
+def _answer_set(answer) -> frozenset[str] | None:
+    """
+    Returns the acceptable answers of an answer given as a set of alternatives,
+    or None for a single answer.
+    """
+    if isinstance(answer, frozenset):
+        return answer
+    if isinstance(answer, set):
+        return frozenset(answer)
+    return None
+
+
+def acceptable_answers(answer: str | frozenset[str]) -> frozenset[str]:
+    """
+    Returns the answers accepted by an answer key entry, whose answer is either a
+    single string or a set of acceptable strings.
+    """
+    answers = _answer_set(answer)
+    return frozenset([answer]) if answers is None else answers
+
+
+@lru_cache(maxsize=None)
+def canonical_answers(
+    answers: frozenset[str],
+    case_sensitive: bool = True,
+    pairs: tuple[tuple[str, str], ...] = (),
+) -> frozenset[str]:
+    """
+    Returns the canonical forms of a set of acceptable answers, which normalized
+    responses are looked up in: without whitespace, upper-cased unless
+    case_sensitive, and with confusable characters mapped onto their class
+    representatives (see confusable_table). Each set is only built once, so a
+    lookup costs the same however many alternatives there are.
+    """
+    forms = ("".join(a.split()) for a in answers)
+    if not case_sensitive:
+        forms = (f.upper() for f in forms)
+    if pairs:
+        table = confusable_table(pairs, case_sensitive)
+        forms = (f.translate(table) for f in forms)
+    return frozenset(forms)
+
+
+@lru_cache(maxsize=None)
+def _answer_multisets(answers: frozenset[str]) -> frozenset[str]:
+    return frozenset("".join(sorted(a)) for a in canonical_answers(answers))
+
+
+def _compact_answer(answer: "str | NormalizedResponse") -> str:
+    """
+    Returns an answer without whitespace; answers are not reduced to their first
+    contentful line unless they are given as a NormalizedResponse.
+    """
+    if isinstance(answer, NormalizedResponse):
+        return answer.compact
+    return "".join(answer.split())
+
+
+def is_correct(
+    response: str | NormalizedResponse,
+    answer: str | NormalizedResponse | frozenset[str],
+) -> bool:
     """
     Checks if the response matches the answer. Specifically,
     it checks the first contentful line in the response and
     compares it to the answer when both have all whitespace removed.
+    The answer may be a set of acceptable answers.
     """
-    return "".join(extract_content(response).split()) == "".join(answer.split())
+    answers = _answer_set(answer)
+    if answers is not None:
+        return normalize(response).compact in canonical_answers(answers)
+    return normalize(response).compact == _compact_answer(answer)
 
 
-def indel_ratio(response: str, answer: str) -> float:
+def indel_ratio(
+    response: str | NormalizedResponse,
+    answer: str | NormalizedResponse | frozenset[str],
+) -> float:
     """
     Returns the normalized InDel ratio of the response and answer after being preprocessed
-    with extract_content and removal of whitespace.
+    with extract_content and removal of whitespace. For a set of acceptable answers,
+    returns the ratio of the closest one.
     """
-    return ratio(
-        response, answer, processor=lambda s: "".join(extract_content(s).split())
+    answers = _answer_set(answer)
+    if answers is not None:
+        compact = normalize(response).compact
+        return max(ratio(compact, a) for a in canonical_answers(answers))
+    return ratio(normalize(response).compact, normalize(answer).compact)
+
+
+def indel_ratio_matrix(
+    responses: list[str | NormalizedResponse],
+    answers: list[str | NormalizedResponse],
+    score_cutoff: float = 0.0,
+) -> np.ndarray:
+    """
+    Returns the matrix of indel_ratio between every response (rows) and every
+    answer (columns), preprocessing each string only once. Ratios below
+    score_cutoff are reported as 0; pairs whose difference in length alone
+    puts them below the cutoff are skipped without being compared.
+    """
+    response_contents = [normalize(r).compact for r in responses]
+    answer_contents = [normalize(a).compact for a in answers]
+    response_lengths = np.array([len(r) for r in response_contents])[:, None]
+    answer_lengths = np.array([len(a) for a in answer_contents])[None, :]
+
+    # the InDel distance is at least the difference in length
+    total_lengths = response_lengths + answer_lengths
+    upper_bounds = np.divide(
+        2 * np.minimum(response_lengths, answer_lengths),
+        total_lengths,
+        out=np.ones(total_lengths.shape),
+        where=total_lengths > 0,
     )
 
+    similarities = np.zeros(upper_bounds.shape)
+    for i, j in zip(*np.nonzero(upper_bounds >= score_cutoff)):
+        similarities[i, j] = ratio(
+            response_contents[i], answer_contents[j], score_cutoff=score_cutoff
+        )
+    return similarities
+
 
-def is_scrambled(response: str, answer: str) -> bool:
+def is_scrambled(
+    response: str | NormalizedResponse,
+    answer: str | NormalizedResponse | frozenset[str],
+) -> bool:
     """
-    Returns True if response is an anagram of answer, ignoring whitespace,
+    Returns True if response is an anagram of answer (or, for a set of
+    acceptable answers, of any of them), ignoring whitespace,
     and returns False otherwise. Uses same filtering as is_correct to
     extract responses from response string.
     """
-    return sorted("".join(extract_content(response).split())) == sorted(
-        "".join(answer.split())
-    )
+    answers = _answer_set(answer)
+    if answers is not None:
+        return normalize(response).multiset in _answer_multisets(answers)
+    if isinstance(answer, NormalizedResponse):
+        answer_multiset = answer.multiset
+    else:
+        answer_multiset = "".join(sorted(_compact_answer(answer)))
+    return normalize(response).multiset == answer_multiset
 
 
 def grounding_context(grounding: str) -> list[str]:
@@ -78,26 +291,146 @@ def grounding_context(grounding: str) -> list[str]:
     raise ValueError(f"Grounding {grounding} not recognized.")
 
 
-def get_failure_mode(response: str, answer: str) -> FailureMode:
+class GroundingContext:
+    """
+    The groundings shown alongside an answer in a question, precomputed for
+    failure mode classification: the whitespace-free context groundings, the
+    set of characters they use and the sorted characters of the answer (of every
+    acceptable answer, for a set of them).
+    """
+
+    __slots__ = ("groundings", "normalized", "characters", "answer_multisets")
+
+    def __init__(self, answer: str | frozenset[str], groundings: list[str]):
+        self.groundings = groundings
+        self.normalized = frozenset("".join(g.split()) for g in groundings)
+        self.characters = frozenset("".join(self.normalized))
+        self.answer_multisets = _answer_multisets(acceptable_answers(answer))
+
+
+def build_context_index(groundings=GROUNDINGS) -> dict[str, GroundingContext]:
+    """
+    Returns a GroundingContext for every grounding in the pilot grounding sets,
+    keyed by the grounding, with the other groundings of its set as context
+    (as in grounding_context).
+    """
+    index: dict[str, GroundingContext] = {}
+    for grounding_list in groundings:
+        flat = grounding_list.flatten().tolist()
+        for grounding in flat:
+            if grounding not in index:
+                index[grounding] = GroundingContext(
+                    grounding, [g for g in flat if g != grounding]
+                )
+    return index
+
+
+PILOT_CONTEXTS = build_context_index()
+
+
+def question_groundings(question: str) -> list[str]:
+    """
+    Returns the groundings shown on the right-hand side of a question.
+    """
+    return [
+        line.split(SEPARATOR)[1].strip()
+        for line in question.split("\n")
+        if SEPARATOR in line and line.split(SEPARATOR)[1].strip()
+    ]
+
+
+def quiz_context_index(
+    quiz_dir: str,
+    experiment_conditions: list[str],
+    answer_key: list[tuple[str, str | None, bool]],
+) -> list[GroundingContext]:
+    """
+    Reads the question files of every quiz in quiz_dir (condition/condition{n}/)
+    in the order of experiment_conditions and returns a GroundingContext for each
+    entry of the flat answer key, with the other groundings in its question text
+    as context. This works for any phase, including phase 2 where the same answer
+    appears in questions with different contexts.
+    """
+    questions: list[str] = []
+    for condition in experiment_conditions:
+        quiz_names = sorted(
+            os.listdir(os.path.join(quiz_dir, condition)),
+            key=lambda name: int(name[len(condition) :]),
+        )
+        for quiz_name in quiz_names:
+            quiz_path = os.path.join(quiz_dir, condition, quiz_name)
+            (questions_file,) = [
+                f for f in os.listdir(quiz_path) if f.endswith("questions.csv")
+            ]
+            with open(os.path.join(quiz_path, questions_file), encoding="utf-8") as f:
+                questions += [row[0] for row in csv.reader(f) if row]
+    if len(questions) != len(answer_key):
+        raise ValueError(
+            f"Found {len(questions)} questions in {quiz_dir} "
+            f"but the answer key has {len(answer_key)} answers."
+        )
+    return [
+        GroundingContext(
+            answer[0],
+            [
+                g
+                for g in dict.fromkeys(question_groundings(question))
+                if g not in acceptable_answers(answer[0])
+            ],
+        )
+        for question, answer in zip(questions, answer_key)
+    ]
+
+
+def get_failure_mode(
+    response: str | NormalizedResponse,
+    answer: str,
+    context: GroundingContext | None = None,
+) -> FailureMode:
     """
     Takes an incorrect response and the corresponding correct answer
     and returns a FailureMode describing the way in which the response
-    is incorrect.
+    is incorrect. The context defaults to the pilot grounding set of the
+    answer; other questions need their context from quiz_context_index.
     """
-    context = grounding_context(answer)  #! This doesn't extend to phase 2
-    for grounding in context:
-        if is_correct(response, grounding):
-            return FailureMode.COPY_CONTEXT
-    if is_scrambled(response, answer):
+    if context is None:
+        if answer not in PILOT_CONTEXTS:
+            raise ValueError(f"Grounding {answer} not recognized.")
+        context = PILOT_CONTEXTS[answer]
+    response = normalize(response)
+    if response.compact in context.normalized:
+        return FailureMode.COPY_CONTEXT
+    if response.multiset in context.answer_multisets:
         return FailureMode.SCRAMBLED
-    if set("".join(extract_content(response).split())).issubset(set("".join(context))):
+    if response.characters <= context.characters:
         return FailureMode.WRONG_COMBINATION
     return FailureMode.OTHER
 
 
+def get_failure_modes(
+    responses: list[str | NormalizedResponse],
+    answers: list[str],
+    contexts: list[GroundingContext | None] | None = None,
+    cache=None,
+) -> list[FailureMode]:
+    """
+    Returns the FailureMode of every incorrect response against its answer (in
+    the matching context, if given). If a GradingCache is given, they are
+    looked up and stored in one batch.
+    """
+    if cache is not None:
+        return cache.get_failure_modes(responses, answers, contexts)
+    if contexts is None:
+        contexts = [None] * len(responses)
+    return [
+        get_failure_mode(response, answer, context)
+        for response, answer, context in zip(responses, answers, contexts)
+    ]
+
+
 def grade_charitably(
     response: str,
-    answer: str,
+    answer: str | frozenset[str],
     pairs: list[tuple[str, str]],
     prompt: str | None = None,
     case_sensitive: bool = False,
@@ -109,12 +442,18 @@ def grade_charitably(
     and a list of pairs of characters that could have been confused with one another.
     If the responses is correct with some combination of replacements of the pairs,
     the response is graded as correct (True). The response is graded incorrect otherwise.
+    The answer may be a set of acceptable answers, if grading_fxn accepts one.
     """
     if prompt:
         if response.startswith(prompt):
             response = response[len(prompt) :]
     if not case_sensitive:
-        response, answer = response.upper(), answer.upper()
+        answers = _answer_set(answer)
+        response = response.upper()
+        if answers is None:
+            answer = answer.upper()
+        else:
+            answer = canonical_answers(answers, case_sensitive=False)
 
     result = (
         any(grading_fxn(response, answer) for response in extract_content_fl(response))
@@ -151,6 +490,276 @@ def grade_charitably(
         )
 
 
+@lru_cache(maxsize=None)
+def confusable_table(
+    pairs: tuple[tuple[str, str], ...], case_sensitive: bool = False
+) -> dict[int, str]:
+    """
+    Takes pairs of characters that could have been confused with one another and
+    returns a str.translate table mapping every character in a confusable class
+    onto a single representative of that class. Pairs that share a character are
+    merged into one class, e.g. ("|", "I") and ("L", "I") give {"|", "I", "L"}.
+    """
+    parent: dict[str, str] = {}
+
+    def find(c: str) -> str:
+        while parent.setdefault(c, c) != c:
+            parent[c] = parent[parent[c]]
+            c = parent[c]
+        return c
+
+    for a, b in pairs:
+        if len(a) != 1 or len(b) != 1:
+            raise ValueError(f"Confusable pair {(a, b)} must be two single characters.")
+        if not case_sensitive:
+            a, b = a.upper(), b.upper()
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+    return {ord(c): find(c) for c in parent if find(c) != c}
+
+
+def grade_confusable(
+    response: str,
+    answer: str | frozenset[str],
+    pairs: list[tuple[str, str]],
+    prompt: str | None = None,
+    case_sensitive: bool = False,
+    grading_fxn: Callable[[str, str], bool] = is_correct,
+    first_and_last: bool = False,
+) -> bool:
+    """
+    Grades a response relative to a correct answer like grade_charitably, but
+    treats the pairs as equivalence classes of confusable characters: both strings
+    are mapped onto class representatives once and graded a single time, so the
+    cost is linear in the length of the response and the number of pairs.
+    Unlike grade_charitably, confusions are resolved per position rather than
+    by replacing every occurrence of a character at once. A set of acceptable
+    answers is mapped onto confusable classes once and then looked up.
+    """
+    if prompt:
+        if response.startswith(prompt):
+            response = response[len(prompt) :]
+    answers = _answer_set(answer)
+    if not case_sensitive:
+        response = response.upper()
+        if answers is None:
+            answer = answer.upper()
+    if pairs:
+        table = confusable_table(tuple(map(tuple, pairs)), case_sensitive)
+        response = response.translate(table)
+        if answers is None:
+            answer = answer.translate(table)
+    if answers is not None:
+        answer = canonical_answers(
+            answers, bool(case_sensitive), tuple(map(tuple, pairs))
+        )
+
+    if first_and_last:
+        return any(grading_fxn(line, answer) for line in extract_content_fl(response))
+    return grading_fxn(response, answer)
+
+
+def _content_column(responses: pd.Series, first_and_last: bool) -> list[pd.Series]:
+    """
+    Vectorized counterpart of extract_content / extract_content_fl: returns the
+    first (and, if first_and_last, the last) contentful line of every response
+    with all whitespace removed.
+    """
+    scanners = [first_contentful_line]
+    if first_and_last:
+        scanners.append(last_contentful_line)
+    contents = [
+        pd.Series([scan(r) for r in responses], index=responses.index, dtype=object)
+        for scan in scanners
+    ]
+    return [c.str.replace(r"\s+", "", regex=True) for c in contents]
+
+
+def grade_batch(
+    responses,
+    answers,
+    prompts=None,
+    case_sensitive=False,
+    first_and_last=False,
+    pairs: list[tuple[str, str]] = [("|", "I")],
+    confusable: bool = False,
+) -> np.ndarray:
+    """
+    Grades equal-length arrays (or Series) of responses and answers at once and
+    returns a boolean array with the verdicts grade_charitably would give using
+    is_correct. prompts and case_sensitive may be scalars or per-row arrays.
+    Normalization is done once per column; the pairs are then tried on the
+    extracted content, or mapped onto confusable classes if confusable is True.
+    An answer may be a set of acceptable answers, whose canonical forms the
+    content of its response is looked up in.
+    """
+    responses = pd.Series(np.asarray(responses, dtype=object), dtype=object)
+    answers = pd.Series(np.asarray(answers, dtype=object), dtype=object)
+    answer_sets = answers.map(_answer_set)
+    multiple = answer_sets.notna().to_numpy()
+    if len(responses) != len(answers):
+        raise ValueError(
+            f"Got {len(responses)} responses but {len(answers)} answers to grade."
+        )
+    for pair in pairs:
+        if any(c.isspace() or c in SEPARATOR for c in pair):
+            raise ValueError(f"Pair {pair} can't be used by grade_batch.")
+    responses = responses.fillna("").astype(str)
+    answers = answers.where(~multiple, "").fillna("").astype(str)
+
+    if prompts is not None:
+        prompts = pd.Series(
+            np.broadcast_to(np.asarray(prompts, dtype=object), len(responses)),
+            dtype=object,
+        )
+        for prompt in prompts.dropna().unique():
+            if not prompt:
+                continue
+            mask = (prompts == prompt) & responses.str.startswith(prompt)
+            responses[mask] = responses[mask].str.slice(len(prompt))
+
+    case_sensitive = np.broadcast_to(
+        np.asarray(case_sensitive, dtype=bool), len(responses)
+    )
+    responses = responses.where(case_sensitive, responses.str.upper())
+    answers = answers.where(case_sensitive, answers.str.upper())
+
+    contents = _content_column(responses, first_and_last)
+    answers = answers.str.replace(r"\s+", "", regex=True)
+    if first_and_last:
+        # extract_content_fl returns no lines at all for a response without content.
+        has_content = (
+            responses.str.replace(SEPARATOR, "\n", regex=False).str.strip("\n") != ""
+        )
+    else:
+        has_content = pd.Series(True, index=responses.index)
+
+    pairs_before_classes = pairs
+    if confusable and pairs:
+        folded = confusable_table(tuple(map(tuple, pairs)))
+        exact = confusable_table(tuple(map(tuple, pairs)), case_sensitive=True)
+
+        def to_classes(column: pd.Series) -> pd.Series:
+            return column.str.translate(exact).where(
+                case_sensitive, column.str.translate(folded)
+            )
+
+        contents = [to_classes(c) for c in contents]
+        answers = to_classes(answers)
+        pairs = []
+
+    def replace(column: pd.Series, old: str, new: str) -> pd.Series:
+        # grade_charitably upper-cases the response again after every replacement
+        replaced = column.str.replace(old, new, regex=False)
+        return replaced.where(case_sensitive, replaced.str.upper())
+
+    variants = contents
+    for a, b in pairs:
+        variants = [
+            v
+            for variant in variants
+            for v in (replace(variant, a, b), replace(variant, b, a), variant)
+        ]
+
+    result = np.zeros(len(responses), dtype=bool)
+    for variant in variants:
+        result |= (variant == answers).to_numpy()
+    result &= ~multiple
+    class_pairs = tuple(map(tuple, pairs_before_classes)) if confusable else ()
+    for row in np.flatnonzero(multiple):
+        canonical = canonical_answers(
+            answer_sets.iat[row], bool(case_sensitive[row]), class_pairs
+        )
+        result[row] = any(variant.iat[row] in canonical for variant in variants)
+    return result & has_content.to_numpy()
+
+
+class ResponseCorpus:
+    """
+    Interns responses into integer codes and grades each distinct
+    (response code, answer index) pair only once against an answer key,
+    scattering the verdicts back to every row that shares it. The grading
+    options (pairs, first_and_last) are fixed per corpus. If a GradingCache
+    is given, verdicts are looked up there before grading.
+    """
+
+    def __init__(
+        self,
+        answer_key: list[tuple[str, str | None, bool]],
+        pairs: list[tuple[str, str]] = [("|", "I")],
+        first_and_last: bool = False,
+        cache=None,
+    ):
+        self.answer_key = answer_key
+        self.pairs = pairs
+        self.first_and_last = first_and_last
+        self.cache = cache
+        self.codes: dict[str, int] = {}
+        self.responses: list[str] = []
+        self.verdicts: dict[int, bool] = {}
+
+    def encode(self, responses) -> np.ndarray:
+        """
+        Returns the integer code of every response, interning unseen ones.
+        """
+        local_codes, uniques = pd.factorize(
+            pd.Series(np.asarray(responses, dtype=object)).fillna("").astype(str)
+        )
+        for response in uniques:
+            if response not in self.codes:
+                self.codes[response] = len(self.responses)
+                self.responses.append(response)
+        global_codes = np.array([self.codes[r] for r in uniques], dtype=np.int64)
+        return global_codes[local_codes]
+
+    def grade(self, responses, answer_indices) -> np.ndarray:
+        """
+        Grades responses against the answers at answer_indices in the answer key
+        and returns a boolean array, grading only pairs not seen before.
+        """
+        codes = self.encode(responses)
+        answer_indices = np.asarray(answer_indices, dtype=np.int64)
+        keys = codes * len(self.answer_key) + answer_indices
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+
+        ungraded = [int(k) for k in unique_keys if int(k) not in self.verdicts]
+        if ungraded and self.cache is not None:
+            cache_keys = {
+                k: self.cache.key(
+                    "grade",
+                    self.responses[k // len(self.answer_key)],
+                    *self.answer_key[k % len(self.answer_key)],
+                    self.pairs,
+                    self.first_and_last,
+                )
+                for k in ungraded
+            }
+            cached = self.cache.get_many(list(cache_keys.values()))
+            for k, value in zip(ungraded, cached):
+                if value is not None:
+                    self.verdicts[k] = bool(value)
+            ungraded = [k for k in ungraded if k not in self.verdicts]
+        if ungraded:
+            response_codes, answer_codes = np.divmod(ungraded, len(self.answer_key))
+            answers = [self.answer_key[i] for i in answer_codes]
+            verdicts = grade_batch(
+                [self.responses[c] for c in response_codes],
+                [a[0] for a in answers],
+                [a[1] for a in answers],
+                [a[2] for a in answers],
+                self.first_and_last,
+                pairs=self.pairs,
+            )
+            self.verdicts.update(zip(ungraded, verdicts.tolist()))
+            if self.cache is not None:
+                self.cache.put_many([cache_keys[k] for k in ungraded], verdicts)
+
+        return np.array([self.verdicts[int(k)] for k in unique_keys], dtype=bool)[
+            inverse
+        ]
+
+
 def average_propagate_stds(
     data: list[float], stds: list[float], stderrs: list[float]
 ) -> tuple[float, float, float]:
@@ -186,6 +795,31 @@ def summarize_participant_results(
     )
 
 
+TWO_QUIZ_CONDITIONS = [
+    "random_permuted_pairs",
+    "randoms",
+    "categorial",
+    "multi_attribute",
+    "numeric",
+    "numeric_multi_attribute",
+    "relational",
+]
+
+
+def default_condition_schema(
+    experiment_conditions: list[str], questions_per_quiz: int
+) -> dict[str, tuple[int, int]]:
+    """
+    Returns the schema of the phase 1 and phase 2 designs, mapping each condition
+    to its number of quizzes (2 for the conditions in TWO_QUIZ_CONDITIONS, 4 for
+    the rest) and the number of questions per quiz.
+    """
+    return {
+        condition: (2 if condition in TWO_QUIZ_CONDITIONS else 4, questions_per_quiz)
+        for condition in experiment_conditions
+    }
+
+
 def score_stats(
     avg_grade_per_q: list[float],
     avg_grade_per_q_stds: list[float],
@@ -193,82 +827,101 @@ def score_stats(
     experiment_conditions: list[str],
     questions_per_quiz: int,
     model_name=None,
+    condition_schema: dict[str, tuple[int, int]] | None = None,
 ) -> tuple[dict[str, list[float]], dict[str, list[list[float]]]]:
     """
     Create and return two dictionaries containing stats based on
     the scoring information in avg_grade_per_q, the names of
     the experiment conditions, and the number of questions in a quiz.
+    The per-question scores are laid out condition by condition, quiz by quiz,
+    as described by condition_schema (condition -> (number of quizzes,
+    questions per quiz)), which defaults to default_condition_schema.
     """
-    condition_stats: dict[str, list[float]] = {
-        "avg_condition_accuracy": [],
-        "stdevs_per_condition": [],
-        "stderrs_per_condition": [],
-    }
-    question_stats: dict[str, list[list[float]]] = {
-        "regressions": [],
-        "avg_q_accuracy": [],
-        "stdevs_per_q_num": [],
-        "stderrs_per_q_num": [],
-    }
-
-    for experiment_name in experiment_conditions:
-        if experiment_name in [
-            "random_permuted_pairs",
-            "randoms",
-            "categorial",
-            "multi_attribute",
-            "numeric",
-            "numeric_multi_attribute",
-            "relational",
-        ]:
-            num_quizzes = 2
-        else:
-            num_quizzes = 4
-        y = np.array(avg_grade_per_q[: questions_per_quiz * num_quizzes])
-
-        y_stds = np.array(avg_grade_per_q_stds[: questions_per_quiz * num_quizzes])
-
-        y_stderrs = np.array(
-            avg_grade_per_q_stderrs[: questions_per_quiz * num_quizzes]
+    schema = condition_schema or default_condition_schema(
+        experiment_conditions, questions_per_quiz
+    )
+    num_quizzes = np.array([schema[c][0] for c in experiment_conditions])
+    num_questions = np.array([schema[c][1] for c in experiment_conditions])
+    sizes = num_quizzes * num_questions
+    if sizes.sum() > len(avg_grade_per_q):
+        raise ValueError(
+            f"The condition schema needs {sizes.sum()} question scores "
+            f"but only {len(avg_grade_per_q)} were given."
         )
 
-        # y is the score per question in this condition, and the associated std per question (treating a q num in diff quizes as a diff question)
+    # y is the score per question, and the associated std per question (treating a
+    # q num in diff quizes as a diff question); each is reduced onto its q num
+    y = np.asarray(avg_grade_per_q[: sizes.sum()], dtype=float)
+    y_stds = np.asarray(avg_grade_per_q_stds[: sizes.sum()], dtype=float)
+    y_stderrs = np.asarray(avg_grade_per_q_stderrs[: sizes.sum()], dtype=float)
 
-        means_per_q_num: list[float] = []
-        stds_per_q_num: list[float] = []
-        stderrs_per_q_num: list[float] = []
-        for i in range(questions_per_quiz):
-            mean, std, stderr = average_propagate_stds(
-                y[i::questions_per_quiz].copy().tolist(),
-                y_stds[i::questions_per_quiz].copy().tolist(),
-                y_stderrs[i::questions_per_quiz].copy().tolist(),
-            )
-            means_per_q_num.append(mean)
-            stds_per_q_num.append(std)
-            stderrs_per_q_num.append(stderr)
+    condition_of_score = np.repeat(np.arange(len(sizes)), sizes)
+    index_in_condition = np.arange(sizes.sum()) - np.repeat(
+        np.cumsum(sizes) - sizes, sizes
+    )
+    question_offsets = np.cumsum(num_questions) - num_questions
+    q_num_of_score = (
+        question_offsets[condition_of_score]
+        + index_in_condition % num_questions[condition_of_score]
+    )
+    quizzes_per_q_num = np.repeat(num_quizzes, num_questions)
+    num_q_nums = num_questions.sum()
 
-        reg_result = scipy.stats.linregress(
-            np.arange(len(means_per_q_num)), means_per_q_num
-        )
+    means_per_q_num = (
+        np.bincount(q_num_of_score, weights=y, minlength=num_q_nums) / quizzes_per_q_num
+    )
+    stds_per_q_num = (
+        np.sqrt(np.bincount(q_num_of_score, weights=y_stds**2, minlength=num_q_nums))
+        / quizzes_per_q_num
+    )
+    stderrs_per_q_num = (
+        np.sqrt(np.bincount(q_num_of_score, weights=y_stderrs**2, minlength=num_q_nums))
+        / quizzes_per_q_num
+    )
 
-        question_stats["regressions"].append(
-            [reg_result.slope, reg_result.intercept, reg_result.rvalue]  # type: ignore
-        )
-        question_stats["avg_q_accuracy"].append(means_per_q_num)
-        question_stats["stdevs_per_q_num"].append(stds_per_q_num)
-        question_stats["stderrs_per_q_num"].append(stderrs_per_q_num)
+    # the same reduction from q nums onto conditions
+    condition_of_q_num = np.repeat(np.arange(len(sizes)), num_questions)
+    condition_accuracy = (
+        np.bincount(condition_of_q_num, weights=means_per_q_num) / num_questions
+    )
+    condition_std = (
+        np.sqrt(np.bincount(condition_of_q_num, weights=stds_per_q_num**2))
+        / num_questions
+    )
+    condition_stderr = (
+        np.sqrt(np.bincount(condition_of_q_num, weights=stderrs_per_q_num**2))
+        / num_questions
+    )
 
-        condition_accuracy, condition_std, condition_stderr = average_propagate_stds(
-            means_per_q_num, stds_per_q_num, stderrs_per_q_num
-        )
-        condition_stats["avg_condition_accuracy"].append(condition_accuracy)
-        condition_stats["stdevs_per_condition"].append(condition_std)
-        condition_stats["stderrs_per_condition"].append(condition_stderr)
-        avg_grade_per_q = avg_grade_per_q[questions_per_quiz * num_quizzes :]
-        avg_grade_per_q_stds = avg_grade_per_q_stds[questions_per_quiz * num_quizzes :]
-        avg_grade_per_q_stderrs = avg_grade_per_q_stderrs[
-            questions_per_quiz * num_quizzes :
-        ]
+    # least squares fits of accuracy against q num for all conditions at once
+    x = np.arange(num_q_nums) - question_offsets[condition_of_q_num]
+    x_deviations = x - (num_questions[condition_of_q_num] - 1) / 2
+    y_deviations = means_per_q_num - condition_accuracy[condition_of_q_num]
+    ssxm = np.bincount(condition_of_q_num, weights=x_deviations**2)
+    ssym = np.bincount(condition_of_q_num, weights=y_deviations**2)
+    ssxym = np.bincount(condition_of_q_num, weights=x_deviations * y_deviations)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slopes = ssxym / ssxm
+        # like scipy.stats.linregress, r is undefined for constant accuracies
+        rvalues = (ssxym / np.sqrt(ssxm * ssym)).clip(-1, 1)
+    intercepts = condition_accuracy - slopes * (num_questions - 1) / 2
+
+    split_points = np.cumsum(num_questions)[:-1]
+    question_stats: dict[str, list[list[float]]] = {
+        "regressions": np.column_stack([slopes, intercepts, rvalues]).tolist(),
+        "avg_q_accuracy": [a.tolist() for a in np.split(means_per_q_num, split_points)],
+        "stdevs_per_q_num": [
+            a.tolist() for a in np.split(stds_per_q_num, split_points)
+        ],
+        "stderrs_per_q_num": [
+            a.tolist() for a in np.split(stderrs_per_q_num, split_points)
+        ],
+    }
+    condition_stats: dict[str, list[float]] = {
+        "avg_condition_accuracy": condition_accuracy.tolist(),
+        "stdevs_per_condition": condition_std.tolist(),
+        "stderrs_per_condition": condition_stderr.tolist(),
+    }
     return condition_stats, question_stats
 
 
@@ -280,9 +933,13 @@ def model_stats(
     questions_per_quiz: int,
     samples_per_q: int,
     model_name: str,
-    all_subjects_df,
+    all_subjects_df=None,
     suppress_get_failure_modes=False,
     first_and_last: bool = False,
+    cache=None,
+    context_index: list[GroundingContext] | None = None,
+    condition_schema: dict[str, tuple[int, int]] | None = None,
+    accumulator=None,
 ) -> tuple[
     dict[str, list[float]],
     dict[str, list[list[float]]],
@@ -294,98 +951,100 @@ def model_stats(
     Takes a list of paths to a text file of a model's responses to quizzes
     as well as an answer key, the names of the experiment conditions,
     the number of questions per quiz and the number of samples taken
-    per question and returns dictionaries with stats for the model.
+    per question and returns dictionaries with stats for the model,
+    along with a frame of every sampled score appended to all_subjects_df
+    (or on its own if all_subjects_df is None).
+    If a GradingCache is given, grades and failure modes are read from
+    and written to it. Failure modes use the contexts in context_index
+    (one per answer key entry) if given, and the pilot contexts otherwise.
+    condition_schema is passed on to score_stats. If a ScoreAccumulator is
+    given, every sampled score is added to it under model_name.
+    A partial transcript (e.g. of a killed SLURM job) is graded as far as it
+    goes, with a warning; questions without any sampled responses get nan
+    scores.
     """
 
-    responses = []
-    for path in paths:
-        with open(path, "r", encoding="utf-8") as f:
-            responses += ast.literal_eval(f.read().split("printing all_responses")[1])
-
-    model_grades = []
-    incorrect_responses: list[list[tuple[int, str, str, str]]] = []
-    failure_modes: list[float] = [0 for _ in range(len(FailureMode))]
-    # scores (all 0 or 1) for each sampled response
-    for quiz in range(num_quizzes):
-        wrongs = []
-        for question in range(questions_per_quiz):
-            for sample in range(samples_per_q):
-                response_index = (
-                    quiz * questions_per_quiz * samples_per_q
-                    + question * samples_per_q
-                    + sample
-                )
-                score = int(
-                    grade_charitably(
-                        responses[response_index],
-                        answer_key[response_index // samples_per_q][0],
-                        [("|", "I")],
-                        prompt=answer_key[response_index // samples_per_q][1],
-                        case_sensitive=answer_key[response_index // samples_per_q][2],
-                        first_and_last=first_and_last,
-                    )
-                )
-                model_grades.append(score)
-
-                df_app = pd.DataFrame(
-                    {
-                        "subject_type": model_name,
-                        "quiz_number": quiz,
-                        "quiz_class": "",
-                        "respondent_scores": score,
-                        "question_num": (question + 1),
-                    },
-                    index=[0],
-                )
-                all_subjects_df = pd.concat(
-                    [all_subjects_df, df_app], ignore_index=True
-                )
+    responses = read_responses(paths)
 
-                if score != 1:
-                    prev_answer = " "
-                    if ((response_index - samples_per_q) // samples_per_q) >= 0:
-                        prev_answer = answer_key[
-                            (response_index - samples_per_q) // samples_per_q
-                        ][0]
-                    wrongs.append(
-                        (
-                            question,
-                            responses[response_index],
-                            answer_key[response_index // samples_per_q][0],
-                            prev_answer,
-                        )
-                    )
-                    if not (suppress_get_failure_modes):
-                        failure_modes[
-                            get_failure_mode(
-                                responses[response_index],
-                                answer_key[response_index // samples_per_q][0],
-                            ).value
-                        ] += 1
-        incorrect_responses.append(wrongs)
+    expected_responses = num_quizzes * questions_per_quiz * samples_per_q
+    num_responses = min(len(responses), expected_responses)
+    if num_responses < expected_responses:
+        warnings.warn(
+            f"{', '.join(paths)} has {len(responses)} of the {expected_responses} "
+            f"expected responses; the missing samples of {model_name} are scored "
+            "as nan."
+        )
+    grades = ResponseCorpus(
+        answer_key, first_and_last=first_and_last, cache=cache
+    ).grade(responses[:num_responses], np.arange(num_responses) // samples_per_q)
 
-    if not (suppress_get_failure_modes):
-        failure_modes = [n / sum(failure_modes) for n in failure_modes]
+    if accumulator is not None:
+        accumulator.add_many(
+            model_name, np.arange(num_responses) // samples_per_q, grades
+        )
 
-    # average score of sampled responses for each question
+    # scores (all 0 or 1) for each sampled response
+    model_grades: list[int] = grades.astype(int).tolist()
+    quiz_numbers = np.arange(num_responses) // (questions_per_quiz * samples_per_q)
+    question_numbers = (np.arange(num_responses) // samples_per_q) % questions_per_quiz
+    model_df = pd.DataFrame(
+        {
+            "subject_type": model_name,
+            "quiz_number": quiz_numbers,
+            "quiz_class": "",
+            "respondent_scores": model_grades,
+            "question_num": question_numbers + 1,
+        }
+    )
 
-    model_avg_grade_per_q: list[float] = [
-        np.average(model_grades[i : i + samples_per_q])  # type: ignore
-        for i in range(0, len(model_grades), samples_per_q)
+    incorrect_responses: list[list[tuple[int, str, str, str]]] = [
+        [] for _ in range(num_quizzes)
     ]
+    failure_modes: list[float] = [0 for _ in range(len(FailureMode))]
+    incorrect_indices = np.flatnonzero(~grades).tolist()
+    for response_index in incorrect_indices:
+        prev_answer = " "
+        if ((response_index - samples_per_q) // samples_per_q) >= 0:
+            prev_answer = answer_key[(response_index - samples_per_q) // samples_per_q][
+                0
+            ]
+        incorrect_responses[quiz_numbers[response_index]].append(
+            (
+                int(question_numbers[response_index]),
+                responses[response_index],
+                answer_key[response_index // samples_per_q][0],
+                prev_answer,
+            )
+        )
 
-    model_avg_grade_per_q_stds: list[float] = [
-        np.std(model_grades[i : i + samples_per_q])  # type: ignore
-        for i in range(0, len(model_grades), samples_per_q)
-    ]
+    if not (suppress_get_failure_modes):
+        questions = [i // samples_per_q for i in incorrect_indices]
+        for failure_mode in get_failure_modes(
+            [responses[i] for i in incorrect_indices],
+            [answer_key[q][0] for q in questions],
+            [context_index[q] for q in questions] if context_index else None,
+            cache,
+        ):
+            failure_modes[failure_mode.value] += 1
+        failure_modes = [n / sum(failure_modes) for n in failure_modes]
 
-    model_avg_grade_per_q_stderrs = [
-        (
-            np.std(model_grades[i : i + samples_per_q])
-            / np.sqrt(np.size(model_grades[i : i + samples_per_q]))
+    # average score of sampled responses for each question, nan for questions
+    # of a partial transcript without any sampled responses
+    model_avg_grade_per_q: list[float] = []
+    model_avg_grade_per_q_stds: list[float] = []
+    model_avg_grade_per_q_stderrs: list[float] = []
+    for i in range(0, expected_responses, samples_per_q):
+        question_grades = model_grades[i : i + samples_per_q]
+        if not question_grades:
+            model_avg_grade_per_q.append(np.nan)
+            model_avg_grade_per_q_stds.append(np.nan)
+            model_avg_grade_per_q_stderrs.append(np.nan)
+            continue
+        model_avg_grade_per_q.append(np.average(question_grades))  # type: ignore
+        model_avg_grade_per_q_stds.append(np.std(question_grades))  # type: ignore
+        model_avg_grade_per_q_stderrs.append(
+            np.std(question_grades) / np.sqrt(np.size(question_grades))
         )
-        for i in range(0, len(model_grades), samples_per_q)
-    ]
 
     return (
         *score_stats(
@@ -395,13 +1054,95 @@ def model_stats(
             experiment_conditions,
             questions_per_quiz,
             model_name=model_name,
+            condition_schema=condition_schema,
         ),
         incorrect_responses,
         failure_modes,
-        all_subjects_df,
+        (
+            model_df
+            if all_subjects_df is None
+            else pd.concat([all_subjects_df, model_df], ignore_index=True)
+        ),
     )
 
 
+def _model_stats_worker(args: tuple[dict, dict, str | None]):
+    spec, shared, cache_path = args
+    if cache_path is None:
+        return model_stats(**shared, **spec), {}, set()
+    from Code.grading_cache import GradingCache
+
+    # workers only read the cache; the parent stores what they found
+    cache = GradingCache(cache_path, deferred=True)
+    try:
+        return model_stats(**shared, **spec, cache=cache), cache.pending, cache.touched
+    finally:
+        cache.close()
+
+
+def model_stats_parallel(
+    model_specs: list[dict],
+    answer_key: list[tuple[str, str | None, bool]],
+    experiment_conditions: list[str],
+    num_quizzes: int,
+    questions_per_quiz: int,
+    samples_per_q: int,
+    max_workers: int | None = None,
+    cache_path: str | None = None,
+    condition_schema: dict[str, tuple[int, int]] | None = None,
+) -> list[
+    tuple[
+        dict[str, list[float]],
+        dict[str, list[list[float]]],
+        list[list[tuple[int, str, str, str]]],
+        list[float],
+        pd.DataFrame,
+    ]
+]:
+    """
+    Runs model_stats for several models in a process pool and returns their
+    results in the order of model_specs. Each spec is a dictionary with the
+    "paths" and "model_name" of a model and, optionally, its "first_and_last"
+    and "suppress_get_failure_modes" settings. If cache_path is given, every
+    worker reads the GradingCache stored there, and the results the workers
+    graded are stored in it by this process in one transaction, so the
+    workers never contend for writes.
+    """
+    shared = {
+        "answer_key": answer_key,
+        "experiment_conditions": experiment_conditions,
+        "num_quizzes": num_quizzes,
+        "questions_per_quiz": questions_per_quiz,
+        "samples_per_q": samples_per_q,
+        "condition_schema": condition_schema,
+    }
+    cache = None
+    if cache_path is not None:
+        from Code.grading_cache import GradingCache
+
+        # opened first so that stale versions are dropped before workers read
+        cache = GradingCache(cache_path)
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            outputs = list(
+                executor.map(
+                    _model_stats_worker,
+                    [(spec, shared, cache_path) for spec in model_specs],
+                )
+            )
+        if cache is not None:
+            pending: dict[str, int] = {}
+            touched: set[str] = set()
+            for _, worker_pending, worker_touched in outputs:
+                pending |= worker_pending
+                touched |= worker_touched
+            cache.write_pending(pending, touched)
+    finally:
+        if cache is not None:
+            cache.close()
+    return [result for result, _, _ in outputs]
+
+
 PILOT_ANSWERS: list[list[tuple[str, str | None, bool]]] = [
     [
         ("C % K % E", "oval => ", False),
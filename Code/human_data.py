@@ -0,0 +1,565 @@
+import os
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(1, "../LLM_Analogical_Reasoning")
+
+import Code.grading_stats as grading_stats
+from Code.accumulators import ScoreAccumulator
+from Code.grading_cache import GRADER_VERSION
+from Code.transcripts import file_signature, write_atomically
+
+# Qualtrics columns holding the answers to the 4 questions of the first quiz;
+# quiz n >= 1 suffixes them with .n
+QUESTION_COLUMNS = ("Q1", "Q3", "Q5", "Q7")
+
+# per-respondent columns kept alongside the long response table
+RESPONDENT_COLUMNS = (
+    "Finished",
+    "Attention",
+    "duration_float",
+    "quiz_number",
+    "quiz_class",
+)
+
+# Qualtrics columns identifying a response in exports without a ResponseId,
+# which do not change once the response is recorded
+IDENTITY_COLUMNS = ("StartDate", "EndDate", "RecordedDate", "Duration (in seconds)")
+
+HUMAN_CACHE_SUFFIX = ".cache.pkl"
+
+
+def quiz_column(column: str, quiz_number: int) -> str:
+    """
+    Returns the name of the Qualtrics column for quiz_number, e.g. Q5.3.
+    """
+    return column if quiz_number == 0 else f"{column}.{quiz_number}"
+
+
+def response_array(
+    human_df: pd.DataFrame,
+    num_quizzes: int,
+    question_columns: tuple[str, ...] = QUESTION_COLUMNS,
+) -> np.ndarray:
+    """
+    Returns the responses of every respondent to every question of every quiz
+    as an object array of shape (respondents, quizzes, questions).
+    """
+    columns = [
+        quiz_column(column, quiz_number)
+        for quiz_number in range(num_quizzes)
+        for column in question_columns
+    ]
+    return (
+        human_df[columns]
+        .to_numpy(dtype=object)
+        .reshape(len(human_df), num_quizzes, len(question_columns))
+    )
+
+
+def melt_responses(
+    human_df: pd.DataFrame,
+    num_quizzes: int,
+    question_columns: tuple[str, ...] = QUESTION_COLUMNS,
+) -> pd.DataFrame:
+    """
+    Melts the answers in a Qualtrics frame into a long table with one row per
+    question of the quiz each respondent took: the respondent (the index label
+    in human_df), quiz_number, quiz_class, question_num (from 1), the raw
+    response and, where human_df has them, the duration and attention check
+    answer of the respondent.
+    """
+    questions_per_quiz = len(question_columns)
+    taken = human_df["quiz_number"].to_numpy(dtype=float)
+    rows = np.flatnonzero(~np.isnan(taken))
+    quizzes = taken[rows].astype(int)
+
+    def per_question(column: str) -> np.ndarray:
+        return np.repeat(human_df[column].to_numpy()[rows], questions_per_quiz)
+
+    # (respondent, question) grids of each respondent's quiz
+    responses = response_array(human_df, num_quizzes, question_columns)[rows, quizzes]
+    melted = pd.DataFrame(
+        {
+            "respondent": np.repeat(human_df.index[rows], questions_per_quiz),
+            "quiz_number": np.repeat(quizzes, questions_per_quiz),
+            "quiz_class": pd.Categorical(per_question("quiz_class")),
+            "question_num": np.tile(np.arange(1, questions_per_quiz + 1), len(rows)),
+            "response": responses.reshape(-1),
+        }
+    )
+    if "duration_float" in human_df:
+        melted["duration"] = per_question("duration_float")
+    if "Attention" in human_df:
+        melted["attention"] = pd.Categorical(per_question("Attention"))
+    return melted
+
+
+def score_humans(
+    responses: pd.DataFrame,
+    answer_key: list[tuple[str, str | None, bool]],
+    corpus: grading_stats.ResponseCorpus | None = None,
+    context_index: list[grading_stats.GroundingContext] | None = None,
+    cache=None,
+    questions_per_quiz: int = len(QUESTION_COLUMNS),
+) -> pd.DataFrame:
+    """
+    Grades a long table of responses from melt_responses, and returns it with
+    the answer, prev_answer (the answer to the question before it, which
+    respondents sometimes copy), score and failure_mode (None for correct
+    responses) of every row. Failure modes are found in the context of
+    context_index if given, and looked up in one batch in a GradingCache if
+    one is given. Without a context_index, only answers from the pilot
+    grounding sets have a context; incorrect responses to other answers (such
+    as those of phase 2) get a failure_mode of None.
+    """
+    if corpus is None:
+        corpus = grading_stats.ResponseCorpus(answer_key)
+    graded = responses.reset_index(drop=True)
+    answer_indices = questions_per_quiz * graded["quiz_number"].to_numpy(
+        dtype=np.int64
+    ) + (graded["question_num"].to_numpy(dtype=np.int64) - 1)
+    answer_texts = np.empty(len(answer_key) + 1, dtype=object)
+    # the first question has no previous answer
+    answer_texts[:] = [" "] + [answer[0] for answer in answer_key]
+    graded["answer"] = answer_texts[answer_indices + 1]
+    graded["prev_answer"] = answer_texts[answer_indices]
+    graded["score"] = corpus.grade(graded["response"], answer_indices).astype(int)
+
+    failure_modes = np.full(len(graded), None, dtype=object)
+    incorrect = np.flatnonzero(graded["score"].to_numpy() != 1)
+    answers = graded["answer"].to_numpy(dtype=object)
+    if context_index is None:
+        has_context = [answers[i] in grading_stats.PILOT_CONTEXTS for i in incorrect]
+        incorrect = incorrect[np.array(has_context, dtype=bool)]
+    # unanswered questions are classified like the empty responses they are
+    # graded as
+    responses = graded["response"].to_numpy(dtype=object)[incorrect]
+    failure_modes[incorrect] = grading_stats.get_failure_modes(
+        ["" if pd.isna(response) else response for response in responses],
+        answers[incorrect].tolist(),
+        (
+            [context_index[i] for i in answer_indices[incorrect]]
+            if context_index is not None
+            else None
+        ),
+        cache,
+    )
+    graded["failure_mode"] = failure_modes
+    return graded
+
+
+def respondent_scores(graded: pd.DataFrame) -> pd.Series:
+    """
+    Returns the average score of every respondent of a frame from score_humans,
+    indexed by respondent.
+    """
+    return graded.groupby("respondent", sort=False)["score"].mean()
+
+
+def question_scores(
+    graded: pd.DataFrame, num_quizzes: int, questions_per_quiz: int
+) -> tuple[list[float], list[float], list[float]]:
+    """
+    Returns the average, standard deviation and standard error of the scores on
+    every question of a frame from score_humans, in answer key order (nan for
+    questions nobody answered), as passed to score_stats.
+    """
+    index = questions_per_quiz * graded["quiz_number"].to_numpy() + (
+        graded["question_num"].to_numpy() - 1
+    )
+    num_questions = num_quizzes * questions_per_quiz
+    scores = graded["score"].to_numpy(dtype=float)
+    counts = np.bincount(index, minlength=num_questions)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = np.bincount(index, scores, num_questions) / counts
+        stds = np.sqrt(
+            np.bincount(index, (scores - means[index]) ** 2, num_questions) / counts
+        )
+        stderrs = stds / np.sqrt(counts)
+    return means.tolist(), stds.tolist(), stderrs.tolist()
+
+
+def failure_mode_counts(graded: pd.DataFrame) -> list[int]:
+    """
+    Returns the number of incorrect responses of a frame from score_humans with
+    each grading_stats.FailureMode, in order of value.
+    """
+    counts = [0 for _ in range(len(grading_stats.FailureMode))]
+    for mode in graded["failure_mode"].dropna():
+        counts[mode.value] += 1
+    return counts
+
+
+def quiz_numbers(
+    human_df: pd.DataFrame, num_quizzes: int, column: str = QUESTION_COLUMNS[0]
+) -> pd.Series:
+    """
+    Returns the quiz each respondent of human_df took, the first quiz whose
+    first question they answered, or nan for respondents who did not finish the
+    survey or answered no quiz.
+    """
+    answered = (
+        human_df[[quiz_column(column, n) for n in range(num_quizzes)]]
+        .notna()
+        .to_numpy()
+    )
+    finished = human_df["Finished"].astype(str).str.lower().to_numpy() == "true"
+    return pd.Series(
+        np.where(finished & answered.any(axis=1), answered.argmax(axis=1), np.nan),
+        index=human_df.index,
+    )
+
+
+def load_human_data(
+    path: str,
+    num_quizzes: int,
+    quiz_to_condition,
+    columns: dict[str, str] = {},
+) -> pd.DataFrame:
+    """
+    Reads a Qualtrics export, renames its columns (e.g. to Consent and
+    Attention) and adds each respondent's quiz_number, quiz_class (the
+    condition given by quiz_to_condition, or "NA" for respondents without a
+    quiz) and duration_float.
+    """
+    human_df = pd.read_csv(path).rename(columns=columns)
+    human_df["quiz_number"] = quiz_numbers(human_df, num_quizzes)
+    conditions = {n: quiz_to_condition(n) for n in range(num_quizzes)}
+    human_df["quiz_class"] = human_df["quiz_number"].map(conditions).fillna("NA")
+    human_df["duration_float"] = pd.to_numeric(
+        human_df["Duration (in seconds)"], errors="coerce"
+    )
+    return human_df
+
+
+def load_responses(
+    path: str,
+    num_quizzes: int,
+    quiz_to_condition,
+    columns: dict[str, str] = {},
+    cache_path: str | None = None,
+    verify_hash: bool = False,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Returns a table of the respondents of the Qualtrics export at path, with
+    its RESPONDENT_COLUMNS (the text ones categorical), and the long table of
+    their responses from melt_responses. Both are pickled next to the export
+    (or at cache_path) and reused until the export's size or modification time
+    changes, or, if verify_hash, its contents change.
+    """
+    cache_path = cache_path or path + HUMAN_CACHE_SUFFIX
+    signature = file_signature(path)
+    options = {
+        "num_quizzes": num_quizzes,
+        "conditions": [quiz_to_condition(n) for n in range(num_quizzes)],
+        "columns": columns,
+    }
+
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                cached = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            cached = {}
+        stale = (
+            any(cached.get(k) != v for k, v in (signature | options).items())
+            or "respondents" not in cached
+        )
+        if verify_hash and not stale:
+            stale = cached["source_hash"] != file_signature(path, True)["source_hash"]
+        if not stale:
+            return cached["respondents"], cached["responses"]
+
+    human_df = load_human_data(path, num_quizzes, quiz_to_condition, columns)
+    respondents = human_df[[c for c in RESPONDENT_COLUMNS if c in human_df]].astype(
+        {
+            c: "category"
+            for c in ["Finished", "Attention", "quiz_class"]
+            if c in human_df
+        }
+    )
+    responses = melt_responses(human_df, num_quizzes)
+    cached = file_signature(path, True) | options
+    cached |= {"respondents": respondents, "responses": responses}
+    try:
+        write_atomically(
+            cache_path,
+            lambda f: pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL),
+        )
+    except OSError:
+        pass  # the cache is optional, e.g. for read-only data directories
+    return respondents, responses
+
+
+class ExclusionRule:
+    """
+    A named criterion for keeping respondents, given as a function from a
+    frame of respondents to a boolean mask of those to keep. Rules see the
+    whole frame, so statistics such as the mean duration are taken over every
+    respondent rather than those kept by earlier rules.
+    """
+
+    def __init__(self, name: str, keep):
+        self.name = name
+        self.keep = keep
+
+    def __call__(self, human_df: pd.DataFrame) -> np.ndarray:
+        return np.asarray(self.keep(human_df), dtype=bool)
+
+    def __repr__(self) -> str:
+        return f"ExclusionRule({self.name!r})"
+
+
+def duration_rule(num_stds: float = 2, column: str = "duration_float") -> ExclusionRule:
+    """
+    Keeps respondents whose duration is within num_stds standard deviations of
+    the mean (dropping those without one).
+    """
+
+    def keep(human_df: pd.DataFrame) -> np.ndarray:
+        durations = human_df[column].to_numpy(dtype=float)
+        mean, std = human_df[column].mean(), human_df[column].std()
+        return np.abs(durations - mean) <= num_stds * std
+
+    return ExclusionRule(f"duration within {num_stds} SD", keep)
+
+
+def attention_rule(answer: str = "8", column: str = "Attention") -> ExclusionRule:
+    """
+    Keeps respondents who gave answer to the attention check.
+    """
+    return ExclusionRule(
+        f"{column} == {answer!r}", lambda human_df: human_df[column] == answer
+    )
+
+
+def finished_rule(column: str = "Finished") -> ExclusionRule:
+    """
+    Keeps respondents who finished the survey.
+    """
+    return ExclusionRule(
+        "finished",
+        lambda human_df: human_df[column].astype(str).str.lower() == "true",
+    )
+
+
+# the exclusions applied in both phases
+DEFAULT_EXCLUSIONS = (duration_rule(), attention_rule(), finished_rule())
+
+
+def exclusion_mask(
+    human_df: pd.DataFrame, rules=DEFAULT_EXCLUSIONS
+) -> tuple[np.ndarray, dict[str, int]]:
+    """
+    Returns the mask of respondents of human_df kept by every rule, and the
+    number of respondents each rule removed that the rules before it kept.
+    """
+    masks = np.array([rule(human_df) for rule in rules], dtype=bool).reshape(
+        len(rules), len(human_df)
+    )
+    kept = np.logical_and.accumulate(masks, axis=0)
+    remaining = np.concatenate([[len(human_df)], kept.sum(axis=1)])
+    removed = {rule.name: int(n) for rule, n in zip(rules, -np.diff(remaining))}
+    mask = kept[-1] if len(rules) else np.ones(len(human_df), dtype=bool)
+    return mask, removed
+
+
+def respondent_ids(
+    human_df: pd.DataFrame,
+    column: str = "ResponseId",
+    question_columns: tuple[str, ...] = QUESTION_COLUMNS,
+) -> pd.Index:
+    """
+    Returns an id for every respondent of a Qualtrics frame: the ResponseId
+    where the export has one, or else a hash of the respondent's
+    IDENTITY_COLUMNS and answers to the question_columns of every quiz
+    (anonymized exports drop the ResponseId). Other columns are left out, so
+    the same respondent gets the same id in every later export, even one that
+    adds or reorders columns.
+    """
+    # in a fixed order, whatever the order of the export
+    identity = [c for c in IDENTITY_COLUMNS if c in human_df]
+    quiz_number = 0
+    while quiz_column(question_columns[0], quiz_number) in human_df:
+        identity += [
+            quiz_column(c, quiz_number)
+            for c in question_columns
+            if quiz_column(c, quiz_number) in human_df
+        ]
+        quiz_number += 1
+    hashes = pd.util.hash_pandas_object(human_df[identity].astype(str), index=False)
+    ids = np.array([f"row-{h:016x}" for h in hashes.to_numpy()], dtype=object)
+    if column in human_df:
+        response_ids = human_df[column].to_numpy(dtype=object)
+        has_id = pd.notna(response_ids)
+        ids[has_id] = response_ids[has_id]
+    return pd.Index(ids, name="respondent")
+
+
+class HumanResponseStore:
+    """
+    The graded responses of every respondent seen in the exports of one survey,
+    pickled at path. Respondents are keyed by respondent_ids, so ingesting a
+    newer export only grades the respondents it has not seen. The scores of the
+    respondents kept by rules are the running statistics in accumulator (with
+    the subject name "human"): newly kept respondents are added to it, and it
+    is rebuilt from kept when a new export makes the rules drop a respondent
+    they kept before (the duration rule depends on every respondent). The
+    store starts over if the answer key, the export layout (including the
+    question_columns of each quiz) or the grader version changes.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        answer_key: list[tuple[str, str | None, bool]],
+        num_quizzes: int,
+        quiz_to_condition,
+        columns: dict[str, str] = {},
+        version: str = GRADER_VERSION,
+        rules=DEFAULT_EXCLUSIONS,
+        question_columns: tuple[str, ...] = QUESTION_COLUMNS,
+    ):
+        self.path = path
+        self.rules = rules
+        self.question_columns = question_columns
+        self.questions_per_quiz = len(question_columns)
+        self.answer_key = answer_key
+        self.num_quizzes = num_quizzes
+        self.quiz_to_condition = quiz_to_condition
+        self.columns = columns
+        self.options = {
+            "version": version,
+            "answer_key": [list(answer) for answer in answer_key],
+            "num_quizzes": num_quizzes,
+            "conditions": [quiz_to_condition(n) for n in range(num_quizzes)],
+            "columns": columns,
+            "question_columns": list(question_columns),
+        }
+        self.respondents = pd.DataFrame(index=pd.Index([], name="respondent"))
+        self.graded = pd.DataFrame()
+        self.accumulator = ScoreAccumulator()
+        # the respondents whose scores are in accumulator
+        self.counted: set | None = set()
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    stored = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+                stored = {}
+            if stored.get("options") == self.options:
+                self.respondents = stored["respondents"]
+                self.graded = stored["graded"]
+                self.accumulator.cells = stored["accumulator"]
+                self.counted = stored.get("counted")
+                # the rules may differ from those the store was saved with
+                self._update_accumulator()
+
+    def ingest(
+        self,
+        export_path: str,
+        corpus: grading_stats.ResponseCorpus | None = None,
+        context_index: list[grading_stats.GroundingContext] | None = None,
+        cache=None,
+    ) -> int:
+        """
+        Grades the respondents of the export at export_path that are not in the
+        store yet, adds them to it and returns how many there were. Call save to
+        persist them. As in score_humans, failure modes of answers outside the
+        pilot need their context_index (e.g. from quiz_context_index) and are
+        None without it.
+        """
+        human_df = load_human_data(
+            export_path, self.num_quizzes, self.quiz_to_condition, self.columns
+        )
+        human_df.index = respondent_ids(
+            human_df, question_columns=self.question_columns
+        )
+        new = (
+            ~human_df.index.isin(self.respondents.index) & ~human_df.index.duplicated()
+        )
+        human_df = human_df[new]
+        if human_df.empty:
+            return 0
+
+        graded = score_humans(
+            melt_responses(human_df, self.num_quizzes, self.question_columns),
+            self.answer_key,
+            corpus,
+            context_index,
+            cache,
+            self.questions_per_quiz,
+        )
+        respondents = human_df[[c for c in RESPONDENT_COLUMNS if c in human_df]]
+        self.respondents = _categorical(
+            pd.concat([self.respondents, respondents]),
+            ["Finished", "Attention", "quiz_class"],
+        )
+        self.graded = _categorical(
+            pd.concat([self.graded, graded], ignore_index=True),
+            ["quiz_class", "attention"],
+        )
+        self._update_accumulator()
+        return len(human_df)
+
+    def kept(self, rules=None) -> tuple[pd.DataFrame, dict[str, int]]:
+        """
+        Returns the graded responses of the respondents kept by rules (the
+        rules of the store by default) and the number of respondents each rule
+        removed, as from exclusion_mask.
+        """
+        mask, removed = exclusion_mask(
+            self.respondents, self.rules if rules is None else rules
+        )
+        kept = self.graded["respondent"].isin(self.respondents.index[mask])
+        return self.graded[kept.to_numpy()], removed
+
+    def _update_accumulator(self):
+        """
+        Brings accumulator up to date with the respondents the rules keep.
+        """
+        mask, _ = exclusion_mask(self.respondents, self.rules)
+        kept = set(self.respondents.index[mask])
+        # stores saved before counted was kept are rebuilt as well
+        if self.counted is None or not self.counted <= kept:
+            self.accumulator, self.counted = ScoreAccumulator(), set()
+        graded = self.graded
+        if not graded.empty:
+            new = graded["respondent"].isin(kept - self.counted).to_numpy()
+            graded = graded[new]
+        if not graded.empty:
+            self.accumulator.add_many(
+                "human",
+                self.questions_per_quiz * graded["quiz_number"]
+                + (graded["question_num"] - 1),
+                graded["score"],
+            )
+        self.counted = kept
+
+    def save(self):
+        """
+        Writes the store to its path.
+        """
+        stored = {
+            "options": self.options,
+            "respondents": self.respondents,
+            "graded": self.graded,
+            "accumulator": self.accumulator.cells,
+            "counted": self.counted,
+        }
+        write_atomically(
+            self.path,
+            lambda f: pickle.dump(stored, f, protocol=pickle.HIGHEST_PROTOCOL),
+        )
+
+
+def _categorical(df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+    """
+    Returns df with the given columns (those it has) as categoricals, which
+    concatenating frames with different categories turns back into objects.
+    """
+    return df.astype({c: "category" for c in columns if c in df})
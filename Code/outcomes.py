@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+
+AXES = ("subject", "quiz", "question", "sample")
+
+# number of set bits in every byte value
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class OutcomeTensor:
+    """
+    Graded outcomes of every subject, indexed by (subject, quiz, question, sample)
+    and stored one bit per outcome, packed along the sample axis. For humans the
+    sample axis holds the respondents who took a quiz. A second bit array marks
+    which outcomes exist, so missing answers and quizzes with fewer respondents
+    are left out of every reduction. About 10^8 outcomes fit in 25MB.
+    """
+
+    def __init__(
+        self,
+        subjects: list[str],
+        num_quizzes: int,
+        questions_per_quiz: int,
+        num_samples: int,
+    ):
+        self.subjects = list(subjects)
+        self.num_samples = num_samples
+        packed_shape = (
+            len(self.subjects),
+            num_quizzes,
+            questions_per_quiz,
+            -(-num_samples // 8),
+        )
+        self.bits = np.zeros(packed_shape, dtype=np.uint8)
+        self.valid = np.zeros(packed_shape, dtype=np.uint8)
+
+    @property
+    def shape(self) -> tuple[int, int, int, int]:
+        return (*self.bits.shape[:3], self.num_samples)
+
+    def _pack(self, array: np.ndarray) -> np.ndarray:
+        return np.packbits(np.asarray(array, dtype=bool), axis=-1, bitorder="little")
+
+    def set(self, subject: str, outcomes, valid=None):
+        """
+        Stores the outcomes of subject, an array of shape (quizzes, questions,
+        samples) or a flat list of grades in that order (as model_stats grades
+        them). Outcomes where valid is False are marked missing.
+        """
+        index = self.subjects.index(subject)
+        shape = self.shape[1:]
+        outcomes = np.asarray(outcomes, dtype=bool).reshape(shape)
+        valid = np.ones(shape, dtype=bool) if valid is None else valid
+        valid = np.asarray(valid, dtype=bool).reshape(shape)
+        self.bits[index] = self._pack(outcomes & valid)
+        self.valid[index] = self._pack(valid)
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pd.DataFrame,
+        subject: str = "subject_type",
+        quiz: str = "quiz_number",
+        question: str = "question_num",
+        value: str = "respondent_scores",
+    ) -> "OutcomeTensor":
+        """
+        Builds a tensor from a frame with one row per graded sample, such as
+        all_subjects_df (with questions numbered from 1). Samples of the same
+        subject, quiz and question are numbered in row order, and rows with a
+        missing value are marked missing.
+        """
+        df = df[df[quiz].notna()]
+        subject_codes, subjects = pd.factorize(df[subject])
+        quizzes = df[quiz].to_numpy(dtype=int)
+        questions = df[question].to_numpy(dtype=int) - 1
+        samples = (
+            df.groupby([subject_codes, quizzes, questions], sort=False)
+            .cumcount()
+            .to_numpy()
+        )
+        tensor = cls(
+            subjects.tolist(), quizzes.max() + 1, questions.max() + 1, samples.max() + 1
+        )
+        outcomes = np.zeros((len(subjects), *tensor.shape[1:]), dtype=bool)
+        valid = np.zeros_like(outcomes)
+        cells = (subject_codes, quizzes, questions, samples)
+        values = df[value].to_numpy(dtype=float)
+        valid[cells] = ~np.isnan(values)
+        outcomes[cells] = np.nan_to_num(values) > 0
+        tensor.bits = tensor._pack(outcomes & valid)
+        tensor.valid = tensor._pack(valid)
+        return tensor
+
+    def select(self, subjects=None, quizzes=None, questions=None) -> "OutcomeTensor":
+        """
+        Returns a tensor with only the given subjects (names), quizzes and
+        questions (indices or slices). Slices give views of this tensor's arrays.
+        """
+        if subjects is None:
+            subject_index: slice | list[int] = slice(None)
+            names = self.subjects
+        elif isinstance(subjects, str):
+            subject_index = [self.subjects.index(subjects)]
+            names = [subjects]
+        else:
+            subject_index = [self.subjects.index(s) for s in subjects]
+            names = list(subjects)
+        index = (
+            subject_index,
+            slice(None) if quizzes is None else quizzes,
+            slice(None) if questions is None else questions,
+        )
+        selected = OutcomeTensor.__new__(OutcomeTensor)
+        selected.subjects = names
+        selected.num_samples = self.num_samples
+        selected.bits = self.bits[index[0]][:, index[1]][:, :, index[2]]
+        selected.valid = self.valid[index[0]][:, index[1]][:, :, index[2]]
+        if selected.bits.ndim != 4:
+            raise ValueError(
+                "Quizzes and questions must be selected with lists or slices."
+            )
+        return selected
+
+    def outcomes(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the unpacked boolean outcomes and validity mask.
+        """
+
+        def unpack(bits: np.ndarray) -> np.ndarray:
+            return np.unpackbits(
+                bits, axis=-1, count=self.num_samples, bitorder="little"
+            ).astype(bool)
+
+        return unpack(self.bits), unpack(self.valid)
+
+    def counts(self, keep: tuple[str, ...] = ()) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the number of correct and of valid outcomes, summed over every
+        axis not named in keep (a subset of AXES).
+        """
+        if any(axis not in AXES for axis in keep):
+            raise ValueError(f"Axes must be among {AXES}.")
+        if "sample" in keep:
+            outcomes, valid = self.outcomes()
+            correct, total = outcomes.astype(np.int64), valid.astype(np.int64)
+        else:
+            correct = POPCOUNT[self.bits].sum(axis=-1, dtype=np.int64)
+            total = POPCOUNT[self.valid].sum(axis=-1, dtype=np.int64)
+        summed = tuple(i for i, axis in enumerate(AXES) if axis not in keep)
+        summed = tuple(i for i in summed if i < correct.ndim)
+        return correct.sum(axis=summed), total.sum(axis=summed)
+
+    def accuracy(self, keep: tuple[str, ...] = ()) -> np.ndarray:
+        """
+        Returns the fraction of valid outcomes that are correct, per entry of the
+        axes in keep (nan where there are no valid outcomes).
+        """
+        correct, total = self.counts(keep)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return correct / total
+
+    def question_means(self, subject: str) -> np.ndarray:
+        """
+        Returns the average score of subject on every question in answer key order,
+        the avg_grade_per_q passed to score_stats.
+        """
+        return self.select(subject).accuracy(("quiz", "question")).reshape(-1)
+
+    def error_overlap(self) -> np.ndarray:
+        """
+        Returns a (subjects, subjects) array counting, for every pair of subjects,
+        the (quiz, question, sample) outcomes that both got wrong. The diagonal
+        holds each subject's number of errors.
+        """
+        errors = (self.valid & ~self.bits).reshape(len(self.subjects), -1)
+        overlap = np.empty((len(self.subjects), len(self.subjects)), dtype=np.int64)
+        for i, subject_errors in enumerate(errors):
+            overlap[i] = POPCOUNT[errors & subject_errors].sum(axis=1, dtype=np.int64)
+        return overlap
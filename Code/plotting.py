@@ -118,7 +118,8 @@ def comparison_bar_plot(
         conditions, labels = labels, conditions
         labels = titleify(labels)
         accuracies = np.transpose(accuracies).tolist()
-        errors = np.transpose(errors).tolist()
+        # also swaps symmetric errors and [below, above] pairs of asymmetric ones
+        errors = np.swapaxes(errors, 0, -1).tolist()
     ax = plt.subplot(111)
     x_axis = np.arange(len(conditions))
     width = 0.9 / len(accuracies)
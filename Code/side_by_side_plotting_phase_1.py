@@ -1,6 +1,6 @@
 import math
+import os
 import sys
-from itertools import cycle
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -15,6 +15,8 @@ sns.set_palette("colorblind")
 sys.path.insert(1, "../LLM_Analogical_Reasoning")
 
 import Code.grading_stats as grading_stats
+import Code.human_data as human_data
+from Code.grading_cache import GradingCache
 
 experiment_conditions = [
     "defaults",  # 0-3
@@ -74,6 +76,18 @@ num_quizzes = 28
 questions_per_quiz = 4
 samples_per_q = 5
 
+# condition -> (number of quizzes, questions per quiz), in answer key order
+condition_schema = {
+    "defaults": (4, questions_per_quiz),
+    "distracted": (4, questions_per_quiz),
+    "permuted_pairs": (4, questions_per_quiz),
+    "permuted_questions": (4, questions_per_quiz),
+    "random_permuted_pairs": (2, questions_per_quiz),
+    "randoms": (2, questions_per_quiz),
+    "only_rhs": (4, questions_per_quiz),
+    "random_finals": (4, questions_per_quiz),
+}
+
 # answer key as a flat list
 answer_key: list[tuple[str, str | None, bool]] = [
     answer
@@ -81,6 +95,15 @@ answer_key: list[tuple[str, str | None, bool]] = [
     for answer in condition
 ]
 
+# if GRADING_CACHE names a sqlite file, grades and failure modes are kept there
+# across runs; stale entries are dropped automatically whenever the grading
+# code changes
+grading_cache = (
+    GradingCache(os.environ["GRADING_CACHE"])
+    if os.environ.get("GRADING_CACHE")
+    else None
+)
+
 all_subjects_df = pd.DataFrame(
     columns=[
         "subject_type",
@@ -96,7 +119,7 @@ all_subjects_df = pd.DataFrame(
     gpt3_arrows_question_stats,
     gpt3_arrows_incorrect_responses,
     gpt3_arrows_failure_modes,
-    all_subjects_df,
+    gpt3_arrows_df,
 ) = grading_stats.model_stats(
     [
         "LLM Data/Phase_1/GPT_arrows/GPT-3/gpt-3_results_arrows.txt",
@@ -107,7 +130,8 @@ all_subjects_df = pd.DataFrame(
     questions_per_quiz,
     samples_per_q,
     model_name="GPT-3",
-    all_subjects_df=all_subjects_df,
+    condition_schema=condition_schema,
+    cache=grading_cache,
 )
 
 
@@ -116,7 +140,7 @@ all_subjects_df = pd.DataFrame(
     gpt4_arrows_question_stats,
     gpt4_arrows_incorrect_responses,
     gpt4_arrows_failure_modes,
-    all_subjects_df,
+    gpt4_arrows_df,
 ) = grading_stats.model_stats(
     [
         "LLM Data/Phase_1/GPT_arrows/GPT-4/gpt-4_results_arrows.txt",
@@ -127,7 +151,8 @@ all_subjects_df = pd.DataFrame(
     questions_per_quiz,
     samples_per_q,
     model_name="GPT-4",
-    all_subjects_df=all_subjects_df,
+    condition_schema=condition_schema,
+    cache=grading_cache,
 )
 
 
@@ -136,7 +161,7 @@ all_subjects_df = pd.DataFrame(
     pythia12b_deduped_question_stats,
     pythia12b_deduped_incorrect_responses,
     pythia12b_deduped_failure_modes,
-    all_subjects_df,
+    pythia12b_deduped_df,
 ) = grading_stats.model_stats(
     [
         "LLM Data/Phase_1/Pythia/12b-deduped_results.txt",
@@ -147,7 +172,8 @@ all_subjects_df = pd.DataFrame(
     questions_per_quiz,
     samples_per_q,
     model_name="Pythia-12B-Deduped",
-    all_subjects_df=all_subjects_df,
+    condition_schema=condition_schema,
+    cache=grading_cache,
 )
 
 (
@@ -155,7 +181,7 @@ all_subjects_df = pd.DataFrame(
     falcon40b_arrows_question_stats,
     falcon40b_arrows_responses,
     falcon40b_arrows_failure_modes,
-    all_subjects_df,
+    falcon40b_arrows_df,
 ) = grading_stats.model_stats(
     [
         "LLM Data/Phase_1/Falcon_arrows/falcon_40b_results_arrows.txt",
@@ -166,7 +192,8 @@ all_subjects_df = pd.DataFrame(
     questions_per_quiz,
     samples_per_q,
     model_name="Falcon-40B-arrows",
-    all_subjects_df=all_subjects_df,
+    condition_schema=condition_schema,
+    cache=grading_cache,
 )
 
 (
@@ -174,7 +201,7 @@ all_subjects_df = pd.DataFrame(
     claude2_question_stats,
     claude2_incorrect_responses,
     claude2_failure_modes,
-    all_subjects_df,
+    claude2_df,
 ) = grading_stats.model_stats(
     [
         "LLM Data/Phase_1/Claude/Claude 2/claude-2_long_results.txt",
@@ -185,7 +212,8 @@ all_subjects_df = pd.DataFrame(
     questions_per_quiz,
     samples_per_q,
     model_name="Claude-2",
-    all_subjects_df=all_subjects_df,
+    condition_schema=condition_schema,
+    cache=grading_cache,
     first_and_last=True,
 )
 
@@ -194,7 +222,7 @@ all_subjects_df = pd.DataFrame(
     claude3opus_question_stats,
     claude3opus_incorrect_responses,
     claude3opus_failure_modes,
-    all_subjects_df,
+    claude3opus_df,
 ) = grading_stats.model_stats(
     [
         "LLM Data/Phase_1/Claude/Claude 3 Opus/claude-3-opus-20240229_results.txt",
@@ -205,35 +233,31 @@ all_subjects_df = pd.DataFrame(
     questions_per_quiz,
     samples_per_q,
     model_name="Claude-3-Opus",
-    all_subjects_df=all_subjects_df,
+    condition_schema=condition_schema,
+    cache=grading_cache,
     first_and_last=True,
 )
 
-all_subjects_df["quiz_class"] = all_subjects_df.apply(classify_quiz, axis=1)
-
-human_df = pd.read_csv("Anonymized Data/Phase 1 (Students)_October 15, 2023_10.49.csv")
-
-human_df = human_df.rename(columns={"Q226": "Consent", "Q222": "Attention"})
-
-
-def extract_quiz_number(row: pd.Series) -> int | None:
-    if row["Finished"].lower() != "true":
-        return None
-    for i in range(28):
-        column = "Q1"
-        if i >= 1:
-            column += f".{i}"
-        if pd.notnull(row[column]):
-            return i
-    return None
-
-
-human_df["quiz_number"] = human_df.apply(extract_quiz_number, axis=1)  # type: ignore
+all_subjects_df = pd.concat(
+    [
+        all_subjects_df,
+        gpt3_arrows_df,
+        gpt4_arrows_df,
+        pythia12b_deduped_df,
+        falcon40b_arrows_df,
+        claude2_df,
+        claude3opus_df,
+    ],
+    ignore_index=True,
+)
 
-human_df["quiz_class"] = human_df.apply(classify_quiz, axis=1)
+all_subjects_df["quiz_class"] = all_subjects_df.apply(classify_quiz, axis=1)
 
-human_df["duration_float"] = pd.to_numeric(
-    human_df["Duration (in seconds)"], errors="coerce"
+human_df, human_responses = human_data.load_responses(
+    "Anonymized Data/Phase 1 (Students)_October 15, 2023_10.49.csv",
+    num_quizzes,
+    quiz_to_condition,
+    columns={"Q226": "Consent", "Q222": "Attention"},
 )
 
 print("Num human subjects phase 1:", human_df.shape[0])
@@ -244,165 +268,81 @@ human_df_for_counts = human_df
 
 print(human_df_for_counts.groupby(["quiz_class"]).size())
 
-mn = human_df["duration_float"].mean()
-std = human_df["duration_float"].std()
-
-human_df = human_df[(human_df["duration_float"]) - mn <= 2 * std]
-human_df = human_df[mn - (human_df["duration_float"]) <= 2 * std]
-human_df = human_df[human_df["Attention"] == "8"]
-
-
-def score_respondent(
-    row: pd.Series,
-    q_scores_per_quiz: list[list[list[int]]],
-    incorrect_responses: list[tuple[str, str, str]],
-    individual_scores: list[list[float]],
-    failure_modes: list[float],
-    scores_grouped_by_quiz: list[list[list[float]]],
-) -> float | None:
-    this_respondent_scores = []
-    quiz_number = row["quiz_number"]
-    if pd.isna(quiz_number):
-        return None
-    else:
-        quiz_number = int(quiz_number)
-    questions = ["Q1", "Q3", "Q5", "Q7"]
-    if quiz_number >= 1:
-        questions = [f"{q}.{quiz_number}" for q in questions]
-    responses: list[str] = [row[q] for q in questions]
-    answers = answer_key[4 * quiz_number : 4 * quiz_number + 4]
-    prev_answers = answer_key[max(0, 4 * quiz_number - 1) : 4 * quiz_number + 4 - 1]
-    if len(prev_answers) < len(
-        answers
-    ):  # max kicked in because we were at the beginning
-        prev_answers.insert(0, (" ", "", False))
-    for i, (response, answer, prev_answer) in enumerate(
-        zip(responses, answers, prev_answers)
-    ):
-        score = int(
-            grading_stats.grade_charitably(
-                response,
-                answer[0],
-                [("|", "I")],
-                prompt=answer[1],
-                case_sensitive=answer[2],
-            )
-        )
-        q_scores_per_quiz[quiz_number][i].append(score)
-        this_respondent_scores.append(score)
-        if score != 1:
-            incorrect_responses.append((response, answer[0], prev_answer[0]))
-            failure_modes[
-                grading_stats.get_failure_mode(response, answer[0]).value
-            ] += 1
-    respondent_overall_score = float(np.mean(np.asarray(this_respondent_scores)))
-    individual_scores[experiment_conditions.index(row["quiz_class"])].append(
-        respondent_overall_score
-    )
-    scores_grouped_by_quiz[overall_number_to_quiz_number(row["quiz_number"]) - 1][
-        experiment_conditions.index(row["quiz_class"])
-    ].append(respondent_overall_score)
-    return respondent_overall_score
+# duration within 2 SD of the mean and passed the attention check; unfinished
+# responses are kept here and go unscored, as they have no quiz number
+human_kept, human_excluded = human_data.exclusion_mask(
+    human_df,
+    [human_data.duration_rule(num_stds=2), human_data.attention_rule("8")],
+)
 
+print("Excluded:", human_excluded)
 
-def score_respondent_all(
-    row: pd.Series,
-    q_scores_per_quiz: list[list[list]],
-    incorrect_responses: list[tuple[str, str, str]],
-    failure_modes: list[float],
-):
-    this_respondent_scores = []
-    quiz_number = row["quiz_number"]
-    if pd.isna(quiz_number):
-        return
-    else:
-        quiz_number = int(quiz_number)
-    questions = ["Q1", "Q3", "Q5", "Q7"]
-    if quiz_number >= 1:
-        questions = [f"{q}.{quiz_number}" for q in questions]
-    responses = [row[q] for q in questions]
-    answers = answer_key[4 * quiz_number : 4 * quiz_number + 4]
-    prev_answers = answer_key[max(0, 4 * quiz_number - 1) : 4 * quiz_number + 4 - 1]
-    if len(prev_answers) < len(
-        answers
-    ):  # max kicked in because we were at the beginning
-        prev_answers.insert(0, (" ", "", False))
-    for i, (response, answer, prev_answer) in enumerate(
-        zip(responses, answers, prev_answers)
-    ):
-        score = int(
-            grading_stats.grade_charitably(
-                response,
-                answer[0],
-                [("|", "I")],
-                prompt=answer[1],
-                case_sensitive=answer[2],
-            )
-        )
-        q_scores_per_quiz[quiz_number][i].append(score)
-        this_respondent_scores.append(score)
-        if score != 1:
-            incorrect_responses.append((response, answer[0], prev_answer[0]))
-            failure_modes[
-                grading_stats.get_failure_mode(response, answer[0]).value
-            ] += 1
-    this_respondent_scores_arr = np.asarray(this_respondent_scores)
-    return this_respondent_scores_arr
+human_df = human_df[human_kept]
+
+
+# every distinct human response is graded once per answer, across respondents
+human_corpus = grading_stats.ResponseCorpus(answer_key, cache=grading_cache)
 
 
 University_Name_df = human_df.copy()
 
-University_Name_q_scores_per_quiz: list[list[list[int]]] = [
-    [[] for _ in range(4)] for _ in range(28)
-]
-University_Name_incorrect_responses: list[tuple[str, str, str]] = []
-University_Name_failure_modes: list[float] = [
-    0 for _ in range(len(grading_stats.FailureMode))
-]
+# one row per graded human response
+University_Name_graded_df = human_data.score_humans(
+    human_responses[human_responses["respondent"].isin(University_Name_df.index)],
+    answer_key,
+    corpus=human_corpus,
+    cache=grading_cache,
+)
+
+University_Name_df["respondent_score"] = human_data.respondent_scores(
+    University_Name_graded_df
+)
+University_Name_scored_df = University_Name_df.dropna(subset=["respondent_score"])
+
+University_Name_incorrect_responses: list[tuple[str, str, str]] = list(
+    University_Name_graded_df.loc[
+        University_Name_graded_df["score"] != 1,
+        ["response", "answer", "prev_answer"],
+    ].itertuples(index=False, name=None)
+)
+University_Name_failure_modes: list[float] = human_data.failure_mode_counts(
+    University_Name_graded_df
+)
 
 University_Name_individual_scores: list[list[float]] = [
-    [] for _ in range(len(experiment_conditions))
+    University_Name_scored_df.loc[
+        University_Name_scored_df["quiz_class"] == condition, "respondent_score"
+    ].tolist()
+    for condition in experiment_conditions
 ]
 University_Name_scores_grouped_by_quiz: list[list[list[float]]] = [
-    [[] for _ in range(len(experiment_conditions))] for _ in range(4)
-]
-
-University_Name_df["respondent_score"] = University_Name_df.apply(
-    lambda row: score_respondent(  # type: ignore
-        row,
-        University_Name_q_scores_per_quiz,
-        University_Name_incorrect_responses,
-        University_Name_individual_scores,
-        University_Name_failure_modes,
-        University_Name_scores_grouped_by_quiz,
-    ),
-    axis=1,
-)
-University_Name_failure_modes = [
-    n / sum(University_Name_failure_modes) for n in University_Name_failure_modes
+    [
+        University_Name_scored_df.loc[
+            (
+                University_Name_scored_df["quiz_number"].map(
+                    overall_number_to_quiz_number
+                )
+                == quiz
+            )
+            & (University_Name_scored_df["quiz_class"] == condition),
+            "respondent_score",
+        ].tolist()
+        for condition in experiment_conditions
+    ]
+    for quiz in range(1, 5)
 ]
 
 University_Name_failure_modes = [
     n / sum(University_Name_failure_modes) for n in University_Name_failure_modes
 ]
 
-University_Name_avg_grade_per_q = [
-    float(np.average(q_scores))
-    for quiz in University_Name_q_scores_per_quiz
-    for q_scores in quiz
-]
-
-University_Name_avg_grade_per_q_stds = [
-    float(np.std(q_scores))
-    for quiz in University_Name_q_scores_per_quiz
-    for q_scores in quiz
-]
-
-University_Name_avg_grade_per_q_stderrs = [
-    (np.std(q_scores) / np.sqrt(np.size(q_scores)))
-    for quiz in University_Name_q_scores_per_quiz
-    for q_scores in quiz
-]
+(
+    University_Name_avg_grade_per_q,
+    University_Name_avg_grade_per_q_stds,
+    University_Name_avg_grade_per_q_stderrs,
+) = human_data.question_scores(
+    University_Name_graded_df, num_quizzes, questions_per_quiz
+)
 
 University_Name_condition_stats, University_Name_question_stats = (
     grading_stats.score_stats(
@@ -411,6 +351,7 @@ University_Name_condition_stats, University_Name_question_stats = (
         University_Name_avg_grade_per_q_stderrs,
         experiment_conditions,
         questions_per_quiz,
+        condition_schema=condition_schema,
     )
 )
 
@@ -1744,39 +1685,14 @@ plt.close()
 # STATISTICAL WORK STARTS HERE #
 ################################
 
-University_Name_df["respondent_scores"] = University_Name_df.apply(
-    lambda row: score_respondent_all(  # type: ignore
-        row,
-        University_Name_q_scores_per_quiz,
-        University_Name_incorrect_responses,
-        University_Name_failure_modes,
-    ),
-    axis=1,
-)
+if grading_cache is not None:
+    grading_cache.close()
 
 University_Name_df = University_Name_df.dropna(subset=["respondent_score"])
 
-University_Name_df_exploded = University_Name_df.explode("respondent_scores")
-
-University_Name_df_exploded["subject_type"] = pd.Series(
-    ["human" for x in range(len(University_Name_df_exploded.index))]
-)
-
-# human_df_exploded = pd.concat([prolific_df_exploded, University_Name_df_exploded])
-human_df_exploded = University_Name_df_exploded
-
-human_df_exploded["respondent_scores"] = pd.to_numeric(
-    human_df_exploded["respondent_scores"]
-)
-
-q_nums = cycle([1, 2, 3, 4])
-human_df_exploded["question_num"] = [
-    next(q_nums) for num in range(len(human_df_exploded))
-]
-
-human_df_subset = human_df_exploded[
-    ["subject_type", "quiz_number", "quiz_class", "respondent_scores", "question_num"]
-]
+human_df_subset = University_Name_graded_df.assign(subject_type="human").rename(
+    columns={"score": "respondent_scores"}
+)[["subject_type", "quiz_number", "quiz_class", "respondent_scores", "question_num"]]
 
 all_subjects_df = pd.concat([all_subjects_df, human_df_subset])
 
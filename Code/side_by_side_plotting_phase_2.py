@@ -1,6 +1,6 @@
 import math
+import os
 import sys
-from itertools import cycle
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -15,6 +15,8 @@ sns.set_palette("colorblind")
 sys.path.insert(1, "../LLM_Analogical_Reasoning")
 
 import Code.grading_stats as grading_stats
+import Code.human_data as human_data
+from Code.grading_cache import GradingCache
 
 experiment_conditions = [
     "categorial",
@@ -51,11 +53,30 @@ num_quizzes = 10
 questions_per_quiz = 4
 samples_per_q = 5
 
+# condition -> (number of quizzes, questions per quiz), in answer key order
+condition_schema = {
+    condition: (2, questions_per_quiz) for condition in experiment_conditions
+}
+
 # answer key as a flat list
 answer_key: list[tuple[str, str | None, bool]] = [
     answer for condition in grading_stats.PHASE_2_ANSWERS for answer in condition
 ]
 
+# the groundings shown in each question, for classifying incorrect responses
+context_index = grading_stats.quiz_context_index(
+    "Quiz_Files/phase_2", experiment_conditions, answer_key
+)
+
+# if GRADING_CACHE names a sqlite file, grades and failure modes are kept there
+# across runs; stale entries are dropped automatically whenever the grading
+# code changes
+grading_cache = (
+    GradingCache(os.environ["GRADING_CACHE"])
+    if os.environ.get("GRADING_CACHE")
+    else None
+)
+
 all_subjects_df = pd.DataFrame(
     columns=[
         "subject_type",
@@ -71,7 +92,7 @@ all_subjects_df = pd.DataFrame(
     gpt3_arrows_question_stats,
     gpt3_arrows_incorrect_responses,
     gpt3_arrows_failure_modes,
-    all_subjects_df,
+    gpt3_arrows_df,
 ) = grading_stats.model_stats(
     [
         "LLM Data/Phase_2/GPT/GPT-3/gpt-3_results_phase2.txt",
@@ -82,8 +103,9 @@ all_subjects_df = pd.DataFrame(
     questions_per_quiz,
     samples_per_q,
     model_name="GPT-3",
-    all_subjects_df=all_subjects_df,
-    suppress_get_failure_modes=True,
+    condition_schema=condition_schema,
+    cache=grading_cache,
+    context_index=context_index,
 )
 
 
@@ -92,7 +114,7 @@ all_subjects_df = pd.DataFrame(
     gpt4_arrows_question_stats,
     gpt4_arrows_incorrect_responses,
     gpt4_arrows_failure_modes,
-    all_subjects_df,
+    gpt4_arrows_df,
 ) = grading_stats.model_stats(
     [
         "LLM Data/Phase_2/GPT/GPT-4/gpt-4_results_phase2.txt",
@@ -103,8 +125,9 @@ all_subjects_df = pd.DataFrame(
     questions_per_quiz,
     samples_per_q,
     model_name="GPT-4",
-    all_subjects_df=all_subjects_df,
-    suppress_get_failure_modes=True,
+    condition_schema=condition_schema,
+    cache=grading_cache,
+    context_index=context_index,
 )
 
 (
@@ -112,7 +135,7 @@ all_subjects_df = pd.DataFrame(
     falcon40b_arrows_question_stats,
     falcon40b_arrows_responses,
     falcon40b_arrows_failure_modes,
-    all_subjects_df,
+    falcon40b_arrows_df,
 ) = grading_stats.model_stats(
     [
         "LLM Data/Phase_2/Falcon/falcon_40b_results_phase2.txt",
@@ -123,8 +146,9 @@ all_subjects_df = pd.DataFrame(
     questions_per_quiz,
     samples_per_q,
     model_name="Falcon-40B-arrows",
-    all_subjects_df=all_subjects_df,
-    suppress_get_failure_modes=True,
+    condition_schema=condition_schema,
+    cache=grading_cache,
+    context_index=context_index,
 )
 
 (
@@ -132,7 +156,7 @@ all_subjects_df = pd.DataFrame(
     claude2_question_stats,
     claude2_incorrect_responses,
     claude2_failure_modes,
-    all_subjects_df,
+    claude2_df,
 ) = grading_stats.model_stats(
     ["LLM Data/Phase_2/Claude/Claude 2/claude-2_results.txt"],
     answer_key,
@@ -141,8 +165,9 @@ all_subjects_df = pd.DataFrame(
     questions_per_quiz,
     samples_per_q,
     model_name="Claude-2",
-    all_subjects_df=all_subjects_df,
-    suppress_get_failure_modes=True,
+    condition_schema=condition_schema,
+    cache=grading_cache,
+    context_index=context_index,
     first_and_last=True,
 )
 
@@ -151,7 +176,7 @@ all_subjects_df = pd.DataFrame(
     claude3opus_question_stats,
     claude3opus_incorrect_responses,
     claude3opus_failure_modes,
-    all_subjects_df,
+    claude3opus_df,
 ) = grading_stats.model_stats(
     ["LLM Data/Phase_2/Claude/Claude 3 Opus/claude-3-opus-20240229_results.txt"],
     answer_key,
@@ -160,8 +185,9 @@ all_subjects_df = pd.DataFrame(
     questions_per_quiz,
     samples_per_q,
     model_name="Claude-3",
-    all_subjects_df=all_subjects_df,
-    suppress_get_failure_modes=True,
+    condition_schema=condition_schema,
+    cache=grading_cache,
+    context_index=context_index,
     first_and_last=True,
 )
 
@@ -170,7 +196,7 @@ all_subjects_df = pd.DataFrame(
     pythia12b_deduped_question_stats,
     pythia12b_deduped_incorrect_responses,
     pythia12b_deduped_failure_modes,
-    all_subjects_df,
+    pythia12b_deduped_df,
 ) = grading_stats.model_stats(
     [
         "LLM Data/Phase_2/Pythia/12b-deduped_results.txt",
@@ -181,36 +207,32 @@ all_subjects_df = pd.DataFrame(
     questions_per_quiz,
     samples_per_q,
     model_name="Pythia-12B-Deduped",
-    all_subjects_df=all_subjects_df,
-    suppress_get_failure_modes=True,
+    condition_schema=condition_schema,
+    cache=grading_cache,
+    context_index=context_index,
 )
 
-all_subjects_df["quiz_class"] = all_subjects_df.apply(classify_quiz, axis=1)
-
-
-human_df = pd.read_csv("Anonymized Data/Phase 2 (Students)_December 5, 2023_14.54.csv")
-
-human_df = human_df.rename(columns={"Q112": "Consent", "Q113": "Attention"})
-
-
-def extract_quiz_number(row: pd.Series) -> int | None:
-    if row["Finished"].lower() != "true":
-        return None
-    for i in range(10):
-        column = "Q1"
-        if i >= 1:
-            column += f".{i}"
-        if pd.notnull(row[column]):
-            return i
-    return None
-
+all_subjects_df = pd.concat(
+    [
+        all_subjects_df,
+        gpt3_arrows_df,
+        gpt4_arrows_df,
+        falcon40b_arrows_df,
+        claude2_df,
+        claude3opus_df,
+        pythia12b_deduped_df,
+    ],
+    ignore_index=True,
+)
 
-human_df["quiz_number"] = human_df.apply(extract_quiz_number, axis=1)  # type: ignore
+all_subjects_df["quiz_class"] = all_subjects_df.apply(classify_quiz, axis=1)
 
-human_df["quiz_class"] = human_df.apply(classify_quiz, axis=1)
 
-human_df["duration_float"] = pd.to_numeric(
-    human_df["Duration (in seconds)"], errors="coerce"
+human_df, human_responses = human_data.load_responses(
+    "Anonymized Data/Phase 2 (Students)_December 5, 2023_14.54.csv",
+    num_quizzes,
+    quiz_to_condition,
+    columns={"Q112": "Consent", "Q113": "Attention"},
 )
 
 print("Num human subjects phase 2 with relational:")
@@ -225,157 +247,72 @@ print("Grouped by condition:")
 
 print(human_df.groupby(["quiz_class"]).size())
 
-mn = human_df["duration_float"].mean()
-std = human_df["duration_float"].std()
-
-human_df = human_df[(human_df["duration_float"]) - mn <= 2 * std]
-human_df = human_df[mn - (human_df["duration_float"]) <= 2 * std]
-human_df = human_df[human_df["Attention"] == "8"]
-
-
-def score_respondent(
-    row: pd.Series,
-    q_scores_per_quiz: list[list[list[int]]],
-    incorrect_responses: list[tuple[str, str, str]],
-    individual_scores: list[list[float]],
-    failure_modes: list[float],
-    scores_grouped_by_quiz: list[list[list[float]]],
-) -> float | None:
-    this_respondent_scores = []
-    quiz_number = row["quiz_number"]
-    if pd.isna(quiz_number):
-        return None
-    else:
-        quiz_number = int(quiz_number)
-    questions = ["Q1", "Q3", "Q5", "Q7"]
-    if quiz_number >= 1:
-        questions = [f"{q}.{quiz_number}" for q in questions]
-    responses: list[str] = [row[q] for q in questions]
-    answers = answer_key[4 * quiz_number : 4 * quiz_number + 4]
-    prev_answers = answer_key[max(0, 4 * quiz_number - 1) : 4 * quiz_number + 4 - 1]
-    if len(prev_answers) < len(
-        answers
-    ):  # max kicked in because we were at the beginning
-        prev_answers.insert(0, (" ", "", False))
-    for i, (response, answer, prev_answer) in enumerate(
-        zip(responses, answers, prev_answers)
-    ):
-        score = int(
-            grading_stats.grade_charitably(
-                response,
-                answer[0],
-                [("|", "I")],
-                prompt=answer[1],
-                case_sensitive=answer[2],
-            )
-        )
-        q_scores_per_quiz[quiz_number][i].append(score)
-        this_respondent_scores.append(score)
-        if score != 1:
-            incorrect_responses.append((response, answer[0], prev_answer[0]))
-            # failure_modes[
-            #     grading_stats.get_failure_mode(response, answer[0]).value
-            # ] += 1
-    respondent_overall_score = float(np.mean(np.asarray(this_respondent_scores)))
-    individual_scores[experiment_conditions.index(row["quiz_class"])].append(
-        respondent_overall_score
-    )
-    scores_grouped_by_quiz[overall_number_to_quiz_number(row["quiz_number"]) - 1][
-        experiment_conditions.index(row["quiz_class"])
-    ].append(respondent_overall_score)
-    return respondent_overall_score
-
-
-def score_respondent_all(
-    row: pd.Series,
-    q_scores_per_quiz: list[list[list]],
-    incorrect_responses: list[tuple[str, str, str]],
-    failure_modes: list[float],
-):
-    this_respondent_scores = []
-    quiz_number = row["quiz_number"]
-    if pd.isna(quiz_number):
-        return
-    else:
-        quiz_number = int(quiz_number)
-    questions = ["Q1", "Q3", "Q5", "Q7"]
-    if quiz_number >= 1:
-        questions = [f"{q}.{quiz_number}" for q in questions]
-    responses = [row[q] for q in questions]
-    answers = answer_key[4 * quiz_number : 4 * quiz_number + 4]
-    prev_answers = answer_key[max(0, 4 * quiz_number - 1) : 4 * quiz_number + 4 - 1]
-    if len(prev_answers) < len(
-        answers
-    ):  # max kicked in because we were at the beginning
-        prev_answers.insert(0, (" ", "", False))
-    for i, (response, answer, prev_answer) in enumerate(
-        zip(responses, answers, prev_answers)
-    ):
-        score = int(
-            grading_stats.grade_charitably(
-                response,
-                answer[0],
-                [("|", "I")],
-                prompt=answer[1],
-                case_sensitive=answer[2],
-            )
-        )
-        q_scores_per_quiz[quiz_number][i].append(score)
-        this_respondent_scores.append(score)
-        if score != 1:
-            incorrect_responses.append((response, answer[0], prev_answer[0]))
-            # failure_modes[
-            #     grading_stats.get_failure_mode(response, answer[0]).value
-            # ] += 1
-    this_respondent_scores_arr = np.asarray(this_respondent_scores)
-    return this_respondent_scores_arr
-
-
-human_q_scores_per_quiz: list[list[list[int]]] = [
-    [[] for _ in range(4)] for _ in range(10)
-]
-human_incorrect_responses: list[tuple[str, str, str]] = []
-human_failure_modes: list[float] = [0 for _ in range(len(grading_stats.FailureMode))]
+# duration within 2 SD of the mean and passed the attention check; unfinished
+# responses are kept here and go unscored, as they have no quiz number
+human_kept, human_excluded = human_data.exclusion_mask(
+    human_df,
+    [human_data.duration_rule(num_stds=2), human_data.attention_rule("8")],
+)
+
+print("Excluded:", human_excluded)
+
+human_df = human_df[human_kept]
 
-human_individual_scores: list[list[float]] = [
-    [] for _ in range(len(experiment_conditions))
-]
-human_scores_grouped_by_quiz: list[list[list[float]]] = [
-    [[] for _ in range(len(experiment_conditions))] for _ in range(2)
-]
 
-human_df["respondent_score"] = human_df.apply(
-    lambda row: score_respondent(  # type: ignore
-        row,
-        human_q_scores_per_quiz,
-        human_incorrect_responses,
-        human_individual_scores,
-        human_failure_modes,
-        human_scores_grouped_by_quiz,
-    ),
-    axis=1,
+# every distinct human response is graded once per answer, across respondents
+human_corpus = grading_stats.ResponseCorpus(answer_key, cache=grading_cache)
+
+
+# one row per graded human response
+human_graded_df = human_data.score_humans(
+    human_responses[human_responses["respondent"].isin(human_df.index)],
+    answer_key,
+    corpus=human_corpus,
+    context_index=context_index,
+    cache=grading_cache,
 )
 
-human_avg_grade_per_q = [
-    float(np.average(q_scores)) for quiz in human_q_scores_per_quiz for q_scores in quiz
-]
+human_df["respondent_score"] = human_data.respondent_scores(human_graded_df)
+human_scored_df = human_df.dropna(subset=["respondent_score"])
 
-human_avg_grade_per_q_stds = [
-    float(np.std(q_scores)) for quiz in human_q_scores_per_quiz for q_scores in quiz
-]
+human_incorrect_responses: list[tuple[str, str, str]] = list(
+    human_graded_df.loc[
+        human_graded_df["score"] != 1, ["response", "answer", "prev_answer"]
+    ].itertuples(index=False, name=None)
+)
+human_failure_modes: list[float] = human_data.failure_mode_counts(human_graded_df)
 
-human_avg_grade_per_q_stderrs = [
-    (np.std(q_scores) / np.sqrt(np.size(q_scores)))
-    for quiz in human_q_scores_per_quiz
-    for q_scores in quiz
+human_individual_scores: list[list[float]] = [
+    human_scored_df.loc[
+        human_scored_df["quiz_class"] == condition, "respondent_score"
+    ].tolist()
+    for condition in experiment_conditions
+]
+human_scores_grouped_by_quiz: list[list[list[float]]] = [
+    [
+        human_scored_df.loc[
+            (human_scored_df["quiz_number"].map(overall_number_to_quiz_number) == quiz)
+            & (human_scored_df["quiz_class"] == condition),
+            "respondent_score",
+        ].tolist()
+        for condition in experiment_conditions
+    ]
+    for quiz in range(1, 3)
 ]
 
+(
+    human_avg_grade_per_q,
+    human_avg_grade_per_q_stds,
+    human_avg_grade_per_q_stderrs,
+) = human_data.question_scores(human_graded_df, num_quizzes, questions_per_quiz)
+
 human_condition_stats, human_question_stats = grading_stats.score_stats(
     human_avg_grade_per_q,
     human_avg_grade_per_q_stds,
     human_avg_grade_per_q_stderrs,
     experiment_conditions,
     questions_per_quiz,
+    condition_schema=condition_schema,
 )
 
 human_means, human_stds, human_stderrs = [], [], []
@@ -650,36 +587,14 @@ plotting.comparison_bar_plot(
 # STATISTICAL WORK STARTS HERE #
 ################################
 
-human_df["respondent_scores"] = human_df.apply(
-    lambda row: score_respondent_all(  # type: ignore
-        row,
-        human_q_scores_per_quiz,
-        human_incorrect_responses,
-        human_failure_modes,
-    ),
-    axis=1,
-)
+if grading_cache is not None:
+    grading_cache.close()
 
 human_df = human_df.dropna(subset=["respondent_score"])
 
-human_df_exploded = human_df.explode("respondent_scores")
-
-human_df_exploded["subject_type"] = pd.Series(
-    ["human" for x in range(len(human_df_exploded.index))]
-)
-
-human_df_exploded["respondent_scores"] = pd.to_numeric(
-    human_df_exploded["respondent_scores"]
-)
-
-q_nums = cycle([1, 2, 3, 4])
-human_df_exploded["question_num"] = [
-    next(q_nums) for num in range(len(human_df_exploded))
-]
-
-human_df_subset = human_df_exploded[
-    ["subject_type", "quiz_number", "quiz_class", "respondent_scores", "question_num"]
-]
+human_df_subset = human_graded_df.assign(subject_type="human").rename(
+    columns={"score": "respondent_scores"}
+)[["subject_type", "quiz_number", "quiz_class", "respondent_scores", "question_num"]]
 
 all_subjects_df = pd.concat([all_subjects_df, human_df_subset])
 
@@ -0,0 +1,193 @@
+import glob
+import os
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(1, "../LLM_Analogical_Reasoning")
+
+from Code.transcripts import PROMPT_HEADER
+
+# "##    Job ID : 1007918" lines of the prolog (and of an epilog, if any)
+HEADER_FIELD = re.compile(r"^##\s+([A-Za-z/ ]+?)\s+:\s+(.*?)\s*$")
+HEADER_FIELDS = {
+    "Job ID": "job_id",
+    "Job Name": "job_name",
+    "Nodelist": "node",
+    "CPUs": "cpus",
+    "Mem/Node": "memory_mb",
+    "Directory": "directory",
+    "Job Started": "start_time",
+    "Job Ended": "end_time",
+}
+MODULES_HEADER = "Currently Loaded Modules:"
+MODULE = re.compile(r"(\d+)\)\s+(\S+)")
+# a quiz file being read before it is prompted, e.g. "Loading defaults1"
+QUIZ_LOADED = re.compile(r"^Loading (\S+)$")
+# the finished progress bar of loading a Hugging Face checkpoint
+SHARDS_LOADED = re.compile(
+    r"Loading checkpoint shards: 100%[^\[]*\[(\d+):(\d+)(?::(\d+))?<"
+)
+PHASE = re.compile(r"Phase_(\d+)")
+TIMEZONE_OFFSETS = {
+    "UTC": 0,
+    "EST": -5,
+    "EDT": -4,
+    "CST": -6,
+    "CDT": -5,
+    "MST": -7,
+    "MDT": -6,
+    "PST": -8,
+    "PDT": -7,
+}
+
+
+def parse_time(text: str) -> pd.Timestamp:
+    """
+    Parses a time as printed by date in a SLURM prolog, e.g.
+    "Fri Mar  8 05:16:11 PM EST 2024", keeping US and UTC time zones.
+    """
+    parts = text.split()
+    offset = None
+    if len(parts) == 7:
+        offset = TIMEZONE_OFFSETS.get(parts.pop(5))
+    try:
+        time = datetime.strptime(" ".join(parts), "%a %b %d %I:%M:%S %p %Y")
+    except ValueError:
+        return pd.NaT
+    if offset is not None:
+        time = time.replace(tzinfo=timezone(timedelta(hours=offset)))
+    return pd.Timestamp(time)
+
+
+def parse_slurm_log(path: str) -> dict:
+    """
+    Reads a slurm-*.out log line by line and returns its job_id, job_name,
+    node, cpus, memory_mb, directory, start_time and end_time (NaT unless the
+    log has an epilog), the loaded modules, and its progress: the quizzes
+    loaded, the prompts sent, the samples requested over all prompts and the
+    seconds spent loading checkpoint shards (nan for API models).
+    """
+    run: dict = {field: None for field in HEADER_FIELDS.values()}
+    run |= {
+        "log": path,
+        "modules": [],
+        "quizzes_loaded": 0,
+        "prompts": 0,
+        "samples": 0,
+        "model_load_seconds": np.nan,
+    }
+    modules: list[tuple[int, str]] = []
+    in_modules = False
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if in_modules:
+                if line.strip():
+                    modules += [(int(n), m) for n, m in MODULE.findall(line)]
+                    continue
+                in_modules = not modules
+            if match := HEADER_FIELD.match(line):
+                field = HEADER_FIELDS.get(match.group(1))
+                if field is not None:
+                    run[field] = match.group(2)
+            elif line.strip() == MODULES_HEADER:
+                in_modules = True
+            elif match := PROMPT_HEADER.fullmatch(line):
+                run["prompts"] += 1
+                run["samples"] += int(match.group(1))
+            elif match := QUIZ_LOADED.match(line):
+                run["quizzes_loaded"] += 1
+            elif match := SHARDS_LOADED.match(line):
+                # the bar is redrawn with carriage returns, which read as new
+                # lines; the last finished bar is kept
+                hours_or_minutes, rest, seconds = match.groups()
+                if seconds:
+                    elapsed = 3600 * int(hours_or_minutes) + 60 * int(rest)
+                    elapsed += int(seconds)
+                else:
+                    elapsed = 60 * int(hours_or_minutes) + int(rest)
+                run["model_load_seconds"] = float(elapsed)
+
+    run["modules"] = [module for _, module in sorted(modules)]
+    for field, convert in [("job_id", int), ("cpus", int)]:
+        if run[field] is not None:
+            run[field] = convert(run[field])
+    if run["memory_mb"] is not None:
+        run["memory_mb"] = int(run["memory_mb"].split()[0])
+    for field in ["start_time", "end_time"]:
+        run[field] = parse_time(run[field]) if run[field] else pd.NaT
+    return run
+
+
+def find_slurm_logs(root: str) -> list[str]:
+    """
+    Returns the paths of every slurm-*.out log under root, sorted.
+    """
+    return sorted(glob.glob(os.path.join(root, "**", "slurm-*.out"), recursive=True))
+
+
+def run_table(
+    paths: list[str],
+    results: pd.DataFrame | None = None,
+    on: str | list[str] = "model",
+) -> pd.DataFrame:
+    """
+    Returns one row per SLURM log with the fields of parse_slurm_log (times in
+    UTC), the phase of the experiment in its path, the transcript
+    (*_results.txt) next to the log and the model it belongs to (named as by
+    load_transcript), and, where the log has an epilog, the elapsed_seconds and
+    samples_per_second of the run. If results, a frame of per-model results
+    such as accuracy, is given, its columns are joined on the on columns (e.g.
+    ["phase", "model"], since models are rerun in every phase).
+    """
+    runs = []
+    for path in paths:
+        run = parse_slurm_log(path)
+        phase = PHASE.search(path)
+        run["phase"] = int(phase.group(1)) if phase else None
+        transcripts = sorted(
+            glob.glob(os.path.join(glob.escape(os.path.dirname(path)), "*_results.txt"))
+        )
+        run["transcript"] = transcripts[0] if transcripts else None
+        run["model"] = (
+            os.path.basename(transcripts[0]).split("_results")[0]
+            if transcripts
+            else None
+        )
+        runs.append(run)
+    table = pd.DataFrame(
+        runs,
+        columns=[
+            "job_id",
+            "job_name",
+            "phase",
+            "model",
+            "node",
+            "cpus",
+            "memory_mb",
+            "start_time",
+            "end_time",
+            "quizzes_loaded",
+            "prompts",
+            "samples",
+            "model_load_seconds",
+            "modules",
+            "directory",
+            "log",
+            "transcript",
+        ],
+    )
+    # prologs print local times, which change offset with daylight saving
+    for field in ["start_time", "end_time"]:
+        table[field] = pd.to_datetime(table[field], utc=True)
+    table["elapsed_seconds"] = (
+        table["end_time"] - table["start_time"]
+    ).dt.total_seconds()
+    table["samples_per_second"] = table["samples"] / table["elapsed_seconds"]
+    if results is not None:
+        table = table.merge(results, on=on, how="left")
+    return table
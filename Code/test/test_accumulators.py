@@ -0,0 +1,71 @@
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(1, "../LLM_Analogical_Reasoning")
+
+from Code.accumulators import ScoreAccumulator
+from Code.grading_stats import score_stats
+
+
+class TestScoreAccumulator(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # 2 conditions of 2 quizzes of 2 questions, 5 samples per question
+        self.conditions = ["defaults", "distracted"]
+        self.schema = {condition: (2, 2) for condition in self.conditions}
+        self.scores = (rng.random(40) < 0.6).astype(int)
+        self.question_indices = np.arange(40) // 5
+
+    def expected(self):
+        per_question = self.scores.reshape(8, 5)
+        return score_stats(
+            per_question.mean(axis=1).tolist(),
+            per_question.std(axis=1).tolist(),
+            (per_question.std(axis=1) / np.sqrt(5)).tolist(),
+            self.conditions,
+            2,
+            condition_schema=self.schema,
+        )
+
+    def assertStatsEqual(self, stats, expected):
+        for actual_dict, expected_dict in zip(stats, expected):
+            self.assertEqual(actual_dict.keys(), expected_dict.keys())
+            for key in actual_dict:
+                np.testing.assert_allclose(
+                    np.array(actual_dict[key], dtype=float),
+                    np.array(expected_dict[key], dtype=float),
+                    equal_nan=True,
+                )
+
+    def test_add(self):
+        accumulator = ScoreAccumulator()
+        for question_index, score in zip(self.question_indices, self.scores):
+            accumulator.add("model", question_index, score)
+        stats = accumulator.stats("model", self.conditions, 2, 8, self.schema)
+        self.assertStatsEqual(stats, self.expected())
+
+    def test_add_many_and_merge(self):
+        workers = [ScoreAccumulator() for _ in range(3)]
+        for i, worker in enumerate(workers):
+            worker.add_many("model", self.question_indices[i::3], self.scores[i::3])
+        accumulator = workers[0].merge(workers[1]).merge(workers[2])
+        stats = accumulator.stats("model", self.conditions, 2, 8, self.schema)
+        self.assertStatsEqual(stats, self.expected())
+
+    def test_partial(self):
+        accumulator = ScoreAccumulator()
+        accumulator.add_many("model", self.question_indices[:20], self.scores[:20])
+        accumulator.add("other", 0, 1)
+        self.assertEqual(accumulator.subjects, ["model", "other"])
+        condition_stats, _ = accumulator.stats(
+            "model", self.conditions, 2, 8, self.schema
+        )
+        accuracy = condition_stats["avg_condition_accuracy"]
+        self.assertAlmostEqual(accuracy[0], self.scores[:20].mean())
+        self.assertTrue(np.isnan(accuracy[1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import contextlib
+import io
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(1, "../LLM_Analogical_Reasoning")
+
+from Code.benchmark_grading import (
+    CONFUSION_PAIRS,
+    benchmark_cases,
+    run_benchmarks,
+    synthetic_corpus,
+)
+from Code.grading_stats import grade_charitably
+
+
+class TestBenchmarkGrading(unittest.TestCase):
+    def test_synthetic_corpus(self):
+        responses, answers = synthetic_corpus(200, seed=1)
+        self.assertEqual(len(responses), 200)
+        self.assertEqual(synthetic_corpus(200, seed=1)[0], responses)
+        grades = [
+            grade_charitably(r, a[0], [("|", "I")], a[1], a[2])
+            for r, a in zip(responses, answers)
+        ]
+        self.assertTrue(0 < sum(grades) < len(grades))
+
+    def test_run_benchmarks(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            records = run_benchmarks([40], pair_counts=[1])
+        self.assertEqual(output.getvalue(), "")
+        self.assertEqual(
+            {r["benchmark"] for r in records},
+            {
+                "grade_charitably",
+                "grade_confusable",
+                "grade_batch",
+                "response_corpus",
+                "grading_cache",
+                "get_failure_mode",
+                "indel_ratio",
+                "model_stats",
+            },
+        )
+        self.assertEqual(
+            [r["cache"] for r in records if r["benchmark"] == "grading_cache"],
+            ["cold", "warm"] * 2,
+        )
+        for record in records:
+            self.assertGreater(record["rows_per_second"], 0)
+            self.assertGreater(record["peak_memory_bytes"], 0)
+        records = run_benchmarks([40], pair_counts=[0], benchmarks=["indel_ratio"])
+        self.assertEqual([r["benchmark"] for r in records], ["indel_ratio"])
+
+    def test_cases_bind_settings(self):
+        responses, answers = synthetic_corpus(100, seed=2)
+        with tempfile.TemporaryDirectory() as directory:
+            # every case is run only once all of them have been yielded
+            cases = list(benchmark_cases(responses, answers, [0, 1], directory))
+            for name, parameters, run in cases:
+                if name != "grade_charitably":
+                    continue
+                pairs = CONFUSION_PAIRS[: parameters["pairs"]]
+                self.assertEqual(
+                    run(),
+                    [
+                        grade_charitably(
+                            r,
+                            a[0],
+                            pairs,
+                            a[1],
+                            a[2],
+                            first_and_last=parameters["first_and_last"],
+                        )
+                        for r, a in zip(responses, answers)
+                    ],
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+import scipy.stats
+
+sys.path.insert(1, "../LLM_Analogical_Reasoning")
+
+from Code.binomial import (
+    binomial_interval,
+    cell_intervals,
+    clopper_pearson_interval,
+    jeffreys_interval,
+    wilson_interval,
+)
+
+
+class TestBinomialIntervals(unittest.TestCase):
+    def setUp(self):
+        self.successes = np.array([0, 1, 3, 5, 12])
+        self.trials = np.array([5, 5, 5, 5, 20])
+
+    def test_against_scipy(self):
+        for interval, method in [
+            (wilson_interval, "wilson"),
+            (clopper_pearson_interval, "exact"),
+        ]:
+            low, high = interval(self.successes, self.trials)
+            for i, (k, n) in enumerate(zip(self.successes, self.trials)):
+                expected = scipy.stats.binomtest(k, n).proportion_ci(0.95, method)
+                self.assertAlmostEqual(low[i], expected.low)
+                self.assertAlmostEqual(high[i], expected.high)
+
+    def test_jeffreys(self):
+        low, high = jeffreys_interval(self.successes, self.trials, 0.9)
+        expected = scipy.stats.beta.ppf([0.05, 0.95], 1.5, 4.5)
+        self.assertAlmostEqual(low[1], expected[0])
+        self.assertAlmostEqual(high[1], expected[1])
+        self.assertEqual((low[0], high[3]), (0, 1))
+
+    def test_no_trials(self):
+        for method in ["wilson", "clopper_pearson", "jeffreys"]:
+            low, high = binomial_interval([0], [0], method)
+            self.assertTrue(np.isnan(low[0]) and np.isnan(high[0]))
+        with self.assertRaises(ValueError):
+            binomial_interval([0], [1], "normal")
+
+    def test_cell_intervals(self):
+        df = pd.DataFrame(
+            {
+                "subject_type": ["a"] * 10,
+                "question_num": [1] * 5 + [2] * 5,
+                "respondent_scores": [1, 1, 1, 1, 1, 0, 1, 0, 0, 0],
+            }
+        )
+        cells = cell_intervals(df, ["subject_type", "question_num"])
+        self.assertEqual(cells["trials"].tolist(), [5, 5])
+        self.assertEqual(cells["accuracy"].tolist(), [1.0, 0.2])
+        # unlike the standard deviation of 5 samples, the interval of a perfect
+        # question is not degenerate
+        self.assertLess(cells["low"][0], 1)
+        self.assertEqual(cells["high"][0], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
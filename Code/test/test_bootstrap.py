@@ -0,0 +1,84 @@
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(1, "../LLM_Analogical_Reasoning")
+
+from Code.bootstrap import (
+    bootstrap_intervals,
+    bootstrap_means,
+    error_bars,
+    frame_intervals,
+    jackknife_acceleration,
+)
+
+
+class TestBootstrap(unittest.TestCase):
+    def test_means(self):
+        values = [1, 0, 1, 1, 0.5, 0.5]
+        groups = ["b", "a", "b", "b", "c", "c"]
+        labels, estimates, resamples = bootstrap_means(values, groups, 100, seed=0)
+        self.assertEqual(labels.tolist(), ["a", "b", "c"])
+        self.assertEqual(estimates.tolist(), [0, 1, 0.5])
+        self.assertEqual(resamples.shape, (100, 3))
+        # every resample stays within its own group
+        self.assertTrue((resamples == estimates).all())
+
+    def test_chunks_and_workers(self):
+        rng = np.random.default_rng(0)
+        values = rng.random(50)
+        groups = np.arange(50) % 3
+        serial = bootstrap_means(values, groups, 40, seed=1, max_elements=500)[2]
+        pooled = bootstrap_means(
+            values, groups, 40, seed=1, max_elements=500, max_workers=2
+        )[2]
+        self.assertTrue(np.array_equal(serial, pooled))
+
+    def test_intervals(self):
+        rng = np.random.default_rng(0)
+        values = (rng.random(200) < 0.7).astype(float)
+        for method in ["percentile", "bca"]:
+            intervals = bootstrap_intervals(
+                values, np.zeros(200), 2000, method=method, seed=0
+            )
+            self.assertLess(intervals["low"][0], intervals["estimate"][0])
+            self.assertGreater(intervals["high"][0], intervals["estimate"][0])
+            # close to the normal approximation for a sample this large
+            mean = values.mean()
+            half_width = 1.96 * np.sqrt(mean * (1 - mean) / 200)
+            self.assertAlmostEqual(intervals["low"][0], mean - half_width, delta=0.01)
+            self.assertAlmostEqual(intervals["high"][0], mean + half_width, delta=0.01)
+        with self.assertRaises(ValueError):
+            bootstrap_intervals(values, np.zeros(200), method="normal")
+
+    def test_acceleration(self):
+        # the leave-one-out skew of a single outlier
+        acceleration = jackknife_acceleration([0, 0, 0, 1, 2, 2], [0, 0, 0, 0, 1, 1])
+        self.assertAlmostEqual(acceleration[0], 1 / (6 * np.sqrt(3)))
+        self.assertEqual(acceleration[1], 0)
+
+    def test_frame_intervals(self):
+        df = pd.DataFrame(
+            {
+                "subject_type": ["human"] * 8,
+                "quiz_class": ["defaults", "randoms"] * 4,
+                "respondent": [0, 1, 2, 3, 0, 1, 2, 3],
+                "respondent_scores": [1, 0, 1, 1, 0, 0, 1, 1],
+            }
+        )
+        intervals = frame_intervals(
+            df, ["subject_type", "quiz_class"], unit=["respondent"], seed=0
+        )
+        self.assertEqual(intervals["quiz_class"].tolist(), ["defaults", "randoms"])
+        self.assertEqual(intervals["estimate"].tolist(), [0.75, 0.5])
+        below, above = error_bars(
+            intervals["estimate"], intervals["low"], intervals["high"]
+        )
+        self.assertEqual(len(below), 2)
+        self.assertTrue(min(below + above) >= 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
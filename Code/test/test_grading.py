@@ -1,9 +1,35 @@
+import os
 import sys
+import tempfile
 import unittest
 
+import numpy as np
+
 sys.path.insert(1, "../LLM_Analogical_Reasoning")
 
-from Code.grading_stats import grade_charitably, is_correct, is_scrambled
+from Code.accumulators import ScoreAccumulator
+from Code.grading_cache import GradingCache
+from Code.grading_stats import (
+    PHASE_2_ANSWERS,
+    FailureMode,
+    GroundingContext,
+    NormalizedResponse,
+    ResponseCorpus,
+    extract_content,
+    extract_content_fl,
+    get_failure_mode,
+    grade_batch,
+    grade_charitably,
+    grade_confusable,
+    indel_ratio,
+    indel_ratio_matrix,
+    is_correct,
+    is_scrambled,
+    model_stats,
+    model_stats_parallel,
+    quiz_context_index,
+    score_stats,
+)
 
 
 class TestGrading(unittest.TestCase):
@@ -62,6 +88,347 @@ class TestGrading(unittest.TestCase):
         )
         self.assertFalse(grade_charitably("Z Q I", "Q Z I", [], case_sensitive=False))
 
+    def test_confusable_correct(self):
+        self.assertTrue(grade_confusable("Q Z I", "Q Z I", []))
+        self.assertTrue(grade_confusable("Q Z |", "Q Z I", [("I", "|")]))
+        self.assertTrue(grade_confusable("Q Z |", "Q Z I", [("|", "I")]))
+        self.assertTrue(grade_confusable("Q Z L", "Q Z I", [("|", "I"), ("L", "I")]))
+        self.assertTrue(grade_confusable("I | I", "I I I", [("|", "I")]))
+        self.assertTrue(grade_confusable("I | I", "| | |", [("|", "I")]))
+        self.assertTrue(grade_confusable("q Z i", "Q z i", [], case_sensitive=False))
+        self.assertTrue(grade_confusable("| |", "I |", [("|", "I")]))
+        self.assertTrue(grade_confusable("0 l", "O 1", [("0", "O"), ("l", "1")]))
+        self.assertTrue(
+            grade_confusable("oval => Q Z |", "Q Z I", [("|", "I")], prompt="oval => ")
+        )
+
+    def test_confusable_incorrect(self):
+        self.assertFalse(grade_confusable("Q Z X", "Q Z I", [("|", "I")]))
+        self.assertFalse(grade_confusable("Q Z I I", "Q Z I", [("|", "I")]))
+        self.assertFalse(grade_confusable("I I I I", "| | |", [("|", "I")]))
+        self.assertFalse(grade_confusable("Z Q I", "Q Z I", [], case_sensitive=False))
+        self.assertFalse(grade_confusable("c c", "C C", [], case_sensitive=True))
+        with self.assertRaises(ValueError):
+            grade_confusable("Q Z I", "Q Z I", [("||", "I")])
+
+    def test_batch(self):
+        responses = ["Q Z |", "oval => c c", "C C", "x\nQ Z I", "", "Q Z X"]
+        answers = ["Q Z I", "c c", "c c", "Q Z I", "", "Q Z I"]
+        prompts = [None, "oval => ", None, None, None, None]
+        case_sensitive = [False, True, True, False, False, False]
+        expected = [
+            grade_charitably(r, a, [("|", "I")], prompt=p, case_sensitive=c)
+            for r, a, p, c in zip(responses, answers, prompts, case_sensitive)
+        ]
+        self.assertEqual(
+            grade_batch(responses, answers, prompts, case_sensitive).tolist(),
+            expected,
+        )
+        self.assertEqual(
+            grade_batch(responses, answers, first_and_last=True).tolist(),
+            [True, True, True, True, False, False],
+        )
+        with self.assertRaises(ValueError):
+            grade_batch(responses, answers[:-1])
+
+    def test_batch_lowercase_pairs(self):
+        pairs = [("|", "I"), ("l", "1"), ("L", "I")]
+        responses = ["1\nlo|", "l", "1 |", "1 |", "L"]
+        answers = ["l", "1", "l I", "l i", "l"]
+        case_sensitive = [False, False, False, True, True]
+        expected = [
+            grade_charitably(r, a, pairs, case_sensitive=c)
+            for r, a, c in zip(responses, answers, case_sensitive)
+        ]
+        self.assertEqual(expected, [True, False, True, False, False])
+        self.assertEqual(
+            grade_batch(
+                responses, answers, case_sensitive=case_sensitive, pairs=pairs
+            ).tolist(),
+            expected,
+        )
+
+    def test_corpus(self):
+        answer_key = [("Q Z I", "oval => ", False), ("c c", None, True)]
+        corpus = ResponseCorpus(answer_key)
+        grades = corpus.grade(
+            ["Q Z |", "Q Z |", "C C", "c c", "Q Z |"], [0, 0, 1, 1, 1]
+        )
+        self.assertEqual(grades.tolist(), [True, True, False, True, False])
+        self.assertEqual(len(corpus.responses), 3)
+        self.assertEqual(len(corpus.verdicts), 4)
+        self.assertEqual(corpus.grade(["c c"], [1]).tolist(), [True])
+        self.assertEqual(len(corpus.verdicts), 4)
+
+    def test_model_stats(self):
+        answers = ["C % K % E", "c c", "*", "Q Q Z Z I I"]
+        blocks = "".join(
+            f"About to prompt model (2 times) with:\n\nQuestion {q % 2 + 1}:\n"
+            "x => \n\n--------- SAMPLED RESPONSE SET ---------\n"
+            + "".join(f"{r}\n" + "-" * 40 + "\n" for r in [answers[q], "?"])
+            + "\n"
+            for q in range(4)
+        )
+        accumulator = ScoreAccumulator()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "model_results.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(blocks)
+            condition_stats, _, incorrect, failure_modes, df = model_stats(
+                [path],
+                [(a, None, a == "c c") for a in answers],
+                ["randoms"],
+                num_quizzes=2,
+                questions_per_quiz=2,
+                samples_per_q=2,
+                model_name="test",
+                suppress_get_failure_modes=True,
+                accumulator=accumulator,
+            )
+        self.assertEqual(condition_stats["avg_condition_accuracy"], [0.5])
+        self.assertEqual(
+            accumulator.stats("test", ["randoms"], 2, 4)[0], condition_stats
+        )
+        self.assertEqual([len(wrongs) for wrongs in incorrect], [2, 2])
+        self.assertEqual(incorrect[1][0], (0, "?", "*", "c c"))
+        self.assertEqual(df["respondent_scores"].tolist(), [1, 0] * 4)
+        self.assertEqual(df["quiz_number"].tolist(), [0, 0, 0, 0, 1, 1, 1, 1])
+        self.assertEqual(df["question_num"].tolist(), [1, 1, 2, 2, 1, 1, 2, 2])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "model_results.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(blocks)
+            results = model_stats_parallel(
+                [
+                    {"paths": [path], "model_name": "a"},
+                    {"paths": [path], "model_name": "b", "first_and_last": True},
+                ],
+                [(a, None, a == "c c") for a in answers],
+                ["randoms"],
+                num_quizzes=2,
+                questions_per_quiz=2,
+                samples_per_q=2,
+                max_workers=2,
+                cache_path=os.path.join(directory, "cache.sqlite"),
+            )
+        self.assertEqual([r[4]["subject_type"].iloc[0] for r in results], ["a", "b"])
+        for result in results:
+            self.assertEqual(result[0], condition_stats)
+            self.assertEqual(result[2], incorrect)
+
+    def test_model_stats_parallel_cache(self):
+        answers = ["C % K % E", "c c", "*", "Q Q Z Z I I"]
+        with tempfile.TemporaryDirectory() as directory:
+            specs = []
+            for n in range(4):
+                path = os.path.join(directory, f"model{n}_results.txt")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(
+                        "".join(
+                            "About to prompt model (2 times) with:\n\n"
+                            f"Question {q % 2 + 1}:\nx => \n\n"
+                            "--------- SAMPLED RESPONSE SET ---------\n"
+                            + "".join(
+                                f"{r}\n" + "-" * 40 + "\n"
+                                for r in [answers[q], "?" * n]
+                            )
+                            for q in range(4)
+                        )
+                    )
+                specs.append({"paths": [path], "model_name": f"model{n}"})
+            cache_path = os.path.join(directory, "cache.sqlite")
+
+            def run():
+                return model_stats_parallel(
+                    specs,
+                    [(a, None, a == "c c") for a in answers],
+                    ["randoms"],
+                    num_quizzes=2,
+                    questions_per_quiz=2,
+                    samples_per_q=2,
+                    max_workers=4,
+                    cache_path=cache_path,
+                )
+
+            results = run()
+            cache = GradingCache(cache_path)
+            # 4 shared correct pairs, and 4 wrong pairs with a failure mode each
+            # per model
+            self.assertEqual(cache.size, 4 + 4 * 4 * 2)
+            cache.close()
+            self.assertEqual([r[3] for r in run()], [r[3] for r in results])
+            cache = GradingCache(cache_path)
+            self.assertEqual(cache.size, 36)
+            cache.close()
+        for result in results:
+            self.assertEqual(result[0]["avg_condition_accuracy"], [0.5])
+
+    def test_model_stats_partial(self):
+        answers = ["C % K % E", "c c", "*", "Q Q Z Z I I"]
+        blocks = [
+            f"About to prompt model (2 times) with:\n\nQuestion {q % 2 + 1}:\n"
+            "x => \n\n--------- SAMPLED RESPONSE SET ---------\n"
+            + "".join(f"{r}\n" + "-" * 40 + "\n" for r in [answers[q], "?"])
+            + "\n"
+            for q in range(4)
+        ]
+        # killed while sampling the third question
+        transcript = "".join(blocks[:2]) + blocks[2][: blocks[2].index("?")]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "model_results.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(transcript)
+            with self.assertWarnsRegex(UserWarning, "has 5 of the 8 expected"):
+                _, question_stats, incorrect, failure_modes, df = model_stats(
+                    [path],
+                    [(a, None, a == "c c") for a in answers],
+                    ["randoms"],
+                    num_quizzes=2,
+                    questions_per_quiz=2,
+                    samples_per_q=2,
+                    model_name="test",
+                )
+        self.assertEqual(df["respondent_scores"].tolist(), [1, 0, 1, 0, 1])
+        self.assertEqual(question_stats["avg_q_accuracy"][0][0], 0.75)
+        self.assertTrue(np.isnan(question_stats["avg_q_accuracy"][0][1]))
+        self.assertEqual([len(wrongs) for wrongs in incorrect], [2, 0])
+        self.assertEqual(sum(failure_modes), 1)
+
+    def test_failure_mode(self):
+        self.assertEqual(get_failure_mode("E K C", "C K E"), FailureMode.COPY_CONTEXT)
+        self.assertEqual(get_failure_mode("C E K", "C K E"), FailureMode.SCRAMBLED)
+        self.assertEqual(
+            get_failure_mode("E % C", "C K E"), FailureMode.WRONG_COMBINATION
+        )
+        self.assertEqual(get_failure_mode("X", "C K E"), FailureMode.OTHER)
+        with self.assertRaises(ValueError):
+            get_failure_mode("X", "not a grounding")
+
+        context = GroundingContext("* *", ["! !", "*"])
+        self.assertEqual(
+            get_failure_mode("! !", "* *", context), FailureMode.COPY_CONTEXT
+        )
+        self.assertEqual(
+            get_failure_mode("* ! *", "* *", context), FailureMode.WRONG_COMBINATION
+        )
+        self.assertEqual(get_failure_mode("? ?", "* *", context), FailureMode.OTHER)
+
+    def test_quiz_context_index(self):
+        answer_key = [answer for condition in PHASE_2_ANSWERS for answer in condition]
+        quiz_dir = os.path.join(os.path.dirname(__file__), "../../Quiz_Files/phase_2")
+        conditions = [
+            "categorial",
+            "multi_attribute",
+            "numeric",
+            "numeric_multi_attribute",
+            "relational",
+        ]
+        index = quiz_context_index(quiz_dir, conditions, answer_key)
+        self.assertEqual(len(index), len(answer_key))
+        self.assertEqual(index[0].groundings, ["!"])
+        self.assertEqual(
+            get_failure_mode("!", answer_key[0][0], index[0]),
+            FailureMode.COPY_CONTEXT,
+        )
+        with self.assertRaises(ValueError):
+            quiz_context_index(quiz_dir, conditions[:1], answer_key)
+
+    def test_indel_ratio_matrix(self):
+        responses = ["C % K % E", "c c\nmore", "", "Q Q Z Z I I"]
+        answers = ["C % K % E", "c c", "Q Q Z Z I I Q Q Z Z I I", ""]
+        matrix = indel_ratio_matrix(responses, answers)
+        self.assertEqual(matrix.shape, (4, 4))
+        for i, response in enumerate(responses):
+            for j, answer in enumerate(answers):
+                self.assertAlmostEqual(matrix[i, j], indel_ratio(response, answer))
+        pruned = indel_ratio_matrix(responses, answers, score_cutoff=0.7)
+        self.assertEqual(pruned[3, 2], 0)
+        self.assertEqual(pruned[0, 0], 1)
+        self.assertEqual(pruned[2, 3], 1)
+
+    def test_extract_content(self):
+        cases = [
+            ("", "", []),
+            ("\n\n", "", []),
+            ("oval => C % K % E\nmore", "oval", ["oval", "more"]),
+            (" => \n Q Z I \n\n", " Q Z I ", [" Q Z I ", " Q Z I "]),
+            ("a\n => => ", "a", ["a", "=> "]),
+            (
+                "first\n" + "filler\n" * 1000 + "x => last => \n",
+                "first",
+                ["first", "last"],
+            ),
+        ]
+        for response, first, first_and_last in cases:
+            self.assertEqual(extract_content(response), first)
+            self.assertEqual(extract_content_fl(response), first_and_last)
+
+    def test_normalized_response(self):
+        text = "\n Z Q  I \nQ Z I"
+        response = NormalizedResponse(text)
+        self.assertIsNone(response._compact)
+        self.assertEqual(response.compact, "ZQI")
+        self.assertEqual(response.multiset, "IQZ")
+        self.assertEqual(response.characters, {"I", "Q", "Z"})
+        answer = NormalizedResponse("Q Z I")
+        for predicate in [is_correct, is_scrambled, indel_ratio]:
+            self.assertEqual(predicate(response, "Q Z I"), predicate(text, "Q Z I"))
+            self.assertEqual(predicate(response, answer), predicate(text, "Q Z I"))
+        self.assertEqual(
+            get_failure_mode(response, "Q Z I"), get_failure_mode(text, "Q Z I")
+        )
+        with self.assertRaises(AttributeError):
+            response.extra = None
+
+    def test_multiple_answers(self):
+        answers = frozenset({"Q Z I", "I Z Q", "c c"})
+        self.assertTrue(is_correct("IZQ\n", answers))
+        self.assertFalse(is_correct("C C", answers))
+        self.assertTrue(is_scrambled("Z I Q", answers))
+        self.assertEqual(indel_ratio("c c", answers), 1)
+        self.assertTrue(grade_charitably("q z |", answers, [("|", "I")]))
+        self.assertFalse(grade_charitably("C C", answers, [], case_sensitive=True))
+        self.assertTrue(grade_confusable("| z q", answers, [("|", "I")]))
+
+        responses = ["q z |", "C C", "x => I Z Q", "Q Z I"]
+        batch_answers = [answers, answers, answers, "Q Z I"]
+        for confusable in [False, True]:
+            self.assertEqual(
+                grade_batch(
+                    responses,
+                    batch_answers,
+                    prompts=[None, None, "x => ", None],
+                    case_sensitive=[False, True, True, False],
+                    confusable=confusable,
+                ).tolist(),
+                [True, False, True, True],
+            )
+
+        context = GroundingContext(answers, ["Y Y", "I Q Z"])
+        self.assertEqual(
+            get_failure_mode("Z Q I", answers, context), FailureMode.SCRAMBLED
+        )
+        self.assertEqual(
+            get_failure_mode("I Q Z", answers, context), FailureMode.COPY_CONTEXT
+        )
+
+    def test_score_stats_schema(self):
+        # "a" has one quiz of 2 questions, "b" two quizzes of 2 questions
+        schema = {"a": (1, 2), "b": (2, 2)}
+        grades = [1.0, 0.5, 0.0, 1.0, 1.0, 0.0]
+        zeros = [0.0] * len(grades)
+        condition_stats, question_stats = score_stats(
+            grades, zeros, zeros, ["a", "b"], 2, condition_schema=schema
+        )
+        self.assertEqual(condition_stats["avg_condition_accuracy"], [0.75, 0.5])
+        self.assertEqual(question_stats["avg_q_accuracy"], [[1.0, 0.5], [0.5, 0.5]])
+        self.assertEqual([r[0] for r in question_stats["regressions"]], [-0.5, 0.0])
+        with self.assertRaises(ValueError):
+            score_stats(
+                grades[:4], zeros, zeros, ["a", "b"], 2, condition_schema=schema
+            )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,95 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(1, "../LLM_Analogical_Reasoning")
+
+from Code.grading_cache import GradingCache
+from Code.grading_stats import FailureMode, ResponseCorpus, get_failure_mode
+
+
+class TestGradingCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        cache = GradingCache(self.path)
+        self.assertTrue(cache.grade_charitably("Q Z |", "Q Z I", [("|", "I")]))
+        self.assertFalse(cache.grade_charitably("Q Z |", "Q Z I", []))
+        self.assertEqual(
+            cache.get_failure_mode("Z Q I", "Q Z I"), FailureMode.SCRAMBLED
+        )
+        cache.close()
+
+        cache = GradingCache(self.path)
+        keys = [
+            cache.key("grade", "Q Z |", "Q Z I", None, False, [("|", "I")]),
+            cache.key("grade", "Q Z |", "Q Z I", None, False, []),
+            cache.key("failure_mode", "Z Q I", "Q Z I"),
+            cache.key("grade", "Q Z |", "Q Z I", None, True, []),
+        ]
+        self.assertEqual(
+            cache.get_many(keys), [1, 0, FailureMode.SCRAMBLED.value, None]
+        )
+        cache.close()
+
+    def test_version_invalidation(self):
+        cache = GradingCache(self.path, version="old")
+        cache.put_many([cache.key("grade", "A", "A")], [1])
+        cache.close()
+
+        cache = GradingCache(self.path, version="new")
+        self.assertEqual(cache.get_many([cache.key("grade", "A", "A")]), [None])
+        (count,) = cache.connection.execute("SELECT COUNT(*) FROM results").fetchone()
+        self.assertEqual(count, 0)
+        cache.close()
+
+    def test_lru_eviction(self):
+        cache = GradingCache(self.path, max_entries=2)
+        keys = [cache.key("grade", r, "A") for r in ["A", "B", "C"]]
+        cache.put_many(keys[:2], [1, 0])
+        cache.get_many(keys[:1])
+        cache.put_many(keys[2:], [0])
+        self.assertEqual(cache.get_many(keys), [1, None, 0])
+        cache.close()
+
+    def test_failure_modes(self):
+        cache = GradingCache(self.path)
+        responses = ["Z Q I", "X", "Z Q I", "Q Z"]
+        answers = ["Q Z I"] * 4
+        expected = [get_failure_mode(r, a) for r, a in zip(responses, answers)]
+        self.assertEqual(cache.get_failure_modes(responses, answers), expected)
+        self.assertEqual(cache.size, 3)
+        cache.close()
+
+        cache = GradingCache(self.path, max_entries=4)
+        self.assertEqual(cache.size, 3)
+        self.assertEqual(cache.get_failure_modes(responses, answers), expected)
+        cache.get_failure_modes(["I", "Z"], ["Q Z I"] * 2)
+        (count,) = cache.connection.execute("SELECT COUNT(*) FROM results").fetchone()
+        self.assertEqual((cache.size, count), (4, 4))
+        cache.close()
+
+    def test_corpus(self):
+        answer_key = [
+            ("Q Z I", "oval => ", False),
+            ("c c", None, True),
+            (frozenset({"* *", "c c"}), None, True),
+        ]
+        cache = GradingCache(self.path)
+        ResponseCorpus(answer_key, cache=cache).grade(["Q Z |", "C C"], [0, 1])
+        corpus = ResponseCorpus(answer_key, cache=cache)
+        grades = corpus.grade(["Q Z |", "C C", "c c", "**"], [0, 1, 1, 2])
+        self.assertEqual(grades.tolist(), [True, False, True, True])
+        (count,) = cache.connection.execute("SELECT COUNT(*) FROM results").fetchone()
+        self.assertEqual(count, 4)
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
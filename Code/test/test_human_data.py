@@ -0,0 +1,379 @@
+import os
+import pickle
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(1, "../LLM_Analogical_Reasoning")
+
+from Code.accumulators import ScoreAccumulator
+from Code.grading_stats import (
+    PHASE_2_ANSWERS,
+    PILOT_ANSWERS,
+    FailureMode,
+    GroundingContext,
+)
+from Code.human_data import (
+    QUESTION_COLUMNS,
+    ExclusionRule,
+    HumanResponseStore,
+    attention_rule,
+    duration_rule,
+    exclusion_mask,
+    failure_mode_counts,
+    finished_rule,
+    load_human_data,
+    load_responses,
+    melt_responses,
+    question_scores,
+    quiz_column,
+    quiz_numbers,
+    respondent_ids,
+    respondent_scores,
+    score_humans,
+)
+
+
+class TestScoreHumans(unittest.TestCase):
+    def setUp(self):
+        # the first 2 quizzes of the pilot
+        self.answer_key = [
+            answer for condition in PILOT_ANSWERS for answer in condition
+        ][:8]
+        nan = np.nan
+        self.human_df = pd.DataFrame(
+            {
+                "Q1": ["C % K % E", nan, "E % C % K", nan],
+                "Q3": ["c c", nan, "c c", nan],
+                "Q5": ["^", nan, "*", nan],
+                "Q7": [nan, nan, "Q Q Z Z I I Q Q Z Z I I", nan],
+                "Q1.1": [nan, "*", nan, nan],
+                "Q3.1": [nan, "Q Z I", nan, nan],
+                "Q5.1": [nan, "X Y", nan, nan],
+                "Q7.1": [nan, "c c", nan, nan],
+                "quiz_number": [0, 1, 0, nan],
+                "quiz_class": ["a", "b", "a", "NA"],
+            },
+            index=[10, 11, 12, 13],
+        )
+
+    def test_melt_responses(self):
+        responses = melt_responses(self.human_df, 2)
+        self.assertEqual(len(responses), 12)
+        self.assertEqual(responses["respondent"].unique().tolist(), [10, 11, 12])
+        self.assertEqual(responses["question_num"].tolist(), [1, 2, 3, 4] * 3)
+        self.assertEqual(
+            responses["response"].iloc[4:8].tolist(), ["*", "Q Z I", "X Y", "c c"]
+        )
+        self.assertIsInstance(responses["quiz_class"].dtype, pd.CategoricalDtype)
+        self.assertNotIn("duration", responses.columns)
+
+    def test_score_humans(self):
+        graded = score_humans(melt_responses(self.human_df, 2), self.answer_key)
+        self.assertEqual(len(graded), 12)
+        self.assertEqual(graded["respondent"].unique().tolist(), [10, 11, 12])
+        self.assertEqual(graded["question_num"].tolist(), [1, 2, 3, 4] * 3)
+        self.assertEqual(graded["score"].tolist(), [1, 1, 0, 0, 1, 0, 0, 1, 0, 1, 1, 1])
+        self.assertEqual(graded["prev_answer"].iloc[0], " ")
+        self.assertEqual(graded["prev_answer"].iloc[4], "Q Q Z Z I I Q Q Z Z I I")
+        wrong = graded[graded["score"] == 0]
+        self.assertEqual(
+            wrong["failure_mode"].tolist(),
+            [
+                FailureMode.COPY_CONTEXT,
+                # unanswered
+                FailureMode.WRONG_COMBINATION,
+                FailureMode.COPY_CONTEXT,
+                FailureMode.OTHER,
+                FailureMode.SCRAMBLED,
+            ],
+        )
+        self.assertTrue(graded.loc[graded["score"] == 1, "failure_mode"].isna().all())
+
+    def test_score_humans_without_context(self):
+        # "!" is not in the pilot grounding sets, but "*" is
+        answer_key = PHASE_2_ANSWERS[0][:4]
+        human_df = pd.DataFrame(
+            {
+                "Q1": [answer_key[0][0], "?"],
+                "Q3": ["?", "?"],
+                "Q5": ["?", np.nan],
+                "Q7": [answer_key[3][0], "?"],
+                "quiz_number": [0, 0],
+                "quiz_class": ["a", "a"],
+            }
+        )
+        graded = score_humans(melt_responses(human_df, 1), answer_key)
+        self.assertEqual(graded["score"].tolist(), [1, 0, 0, 1, 0, 0, 0, 0])
+        self.assertEqual(
+            graded.loc[graded["score"] == 0, "failure_mode"].tolist(),
+            [None, None, FailureMode.OTHER, None, None, FailureMode.OTHER],
+        )
+
+        context = GroundingContext(answer_key[1][0], ["! !"])
+        graded = score_humans(
+            melt_responses(human_df, 1), answer_key, context_index=[context] * 4
+        )
+        self.assertEqual(
+            graded.loc[graded["score"] == 0, "failure_mode"].tolist(),
+            # the empty response uses no characters outside the context
+            [FailureMode.OTHER] * 4
+            + [FailureMode.WRONG_COMBINATION, FailureMode.OTHER],
+        )
+
+    def test_summaries(self):
+        graded = score_humans(melt_responses(self.human_df, 2), self.answer_key)
+        self.assertEqual(
+            respondent_scores(graded).to_dict(), {10: 0.5, 11: 0.5, 12: 0.75}
+        )
+        means, stds, stderrs = question_scores(graded, 2, 4)
+        self.assertEqual(means, [0.5, 1.0, 0.5, 0.5, 1.0, 0.0, 0.0, 1.0])
+        self.assertEqual(stds[:2], [0.5, 0.0])
+        self.assertAlmostEqual(stderrs[0], 0.5 / np.sqrt(2))
+        counts = failure_mode_counts(graded)
+        self.assertEqual(sum(counts), 5)
+        self.assertEqual(counts[FailureMode.SCRAMBLED.value], 1)
+
+
+class TestLoadHumanData(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "export.csv")
+        # Qualtrics exports start with rows of question text and import ids
+        export = pd.DataFrame(
+            {
+                "Finished": ["Finished", '{"ImportId":"finished"}']
+                + ["TRUE", "TRUE", "FALSE", "TRUE"],
+                "Duration (in seconds)": ["Duration", "{}", "100", "200", "5", "x"],
+                "Q112": ["Attention", "{}", "8", "8", "3", "8"],
+            }
+        )
+        first_questions = {
+            "Q1": ["", "", "", ""],
+            "Q1.1": ["", "A", "A", ""],
+            "Q1.2": ["B", "B", "", ""],
+        }
+        for quiz_number in range(3):
+            for column in QUESTION_COLUMNS:
+                column = quiz_column(column, quiz_number)
+                export[column] = ["Question", "{}"] + first_questions.get(
+                    column, [""] * 4
+                )
+        export.to_csv(self.path, index=False)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_quiz_numbers(self):
+        human_df = pd.read_csv(self.path)
+        np.testing.assert_array_equal(
+            quiz_numbers(human_df, 3), [np.nan, np.nan, 2, 1, np.nan, np.nan]
+        )
+        np.testing.assert_array_equal(
+            quiz_numbers(human_df, 2), [np.nan, np.nan, np.nan, 1, np.nan, np.nan]
+        )
+
+    def test_load_human_data(self):
+        human_df = load_human_data(
+            self.path, 3, lambda n: f"condition {n}", {"Q112": "Attention"}
+        )
+        self.assertIn("Attention", human_df.columns)
+        self.assertEqual(
+            human_df["quiz_class"].tolist(),
+            ["NA", "NA", "condition 2", "condition 1", "NA", "NA"],
+        )
+        np.testing.assert_array_equal(
+            human_df["duration_float"], [np.nan, np.nan, 100, 200, 5, np.nan]
+        )
+
+    def test_load_responses(self):
+        def load():
+            return load_responses(
+                self.path, 3, lambda n: f"condition {n}", {"Q112": "Attention"}
+            )
+
+        respondents, responses = load()
+        self.assertEqual(len(respondents), 6)
+        self.assertEqual(respondents["Attention"].iloc[2], "8")
+        self.assertEqual(responses["respondent"].tolist(), [2] * 4 + [3] * 4)
+        first_questions = responses[responses["question_num"] == 1]
+        self.assertEqual(first_questions["response"].tolist(), ["B", "A"])
+        self.assertEqual(first_questions["duration"].tolist(), [100, 200])
+        self.assertEqual(first_questions["attention"].tolist(), ["8", "8"])
+        self.assertTrue(os.path.exists(self.path + ".cache.pkl"))
+
+        # reused until the export changes
+        cached_respondents, _ = load()
+        pd.testing.assert_frame_equal(cached_respondents, respondents)
+        with open(self.path + ".cache.pkl", "rb") as f:
+            self.assertEqual(pickle.load(f)["num_quizzes"], 3)
+        with open(self.path, "a") as f:
+            f.write("TRUE,10,8,Z" + "," * 11 + "\n")
+        respondents, responses = load()
+        self.assertEqual(len(respondents), 7)
+        first_questions = responses[responses["question_num"] == 1]
+        self.assertEqual(first_questions["response"].tolist(), ["B", "A", "Z"])
+
+    def test_respondent_ids(self):
+        human_df = pd.read_csv(self.path)
+        ids = respondent_ids(human_df)
+        self.assertTrue(ids.is_unique)
+        self.assertEqual(respondent_ids(human_df.iloc[3:]).tolist(), ids[3:].tolist())
+        # later exports may add and reorder columns
+        reordered = human_df[human_df.columns[::-1]].assign(Q226=["Consent"] * 6)
+        self.assertEqual(respondent_ids(reordered).tolist(), ids.tolist())
+        self.assertNotEqual(
+            respondent_ids(human_df.assign(**{"Q5.2": "C"})).tolist(), ids.tolist()
+        )
+        human_df["ResponseId"] = [np.nan] * 5 + ["R_1"]
+        self.assertEqual(respondent_ids(human_df).tolist(), ids[:5].tolist() + ["R_1"])
+
+    def test_response_store(self):
+        answer_key = [answer for condition in PILOT_ANSWERS for answer in condition]
+        store_path = os.path.join(self.directory.name, "store.pkl")
+
+        def open_store(answer_key=answer_key[:12]):
+            return HumanResponseStore(
+                store_path,
+                answer_key,
+                3,
+                lambda n: f"condition {n}",
+                {"Q112": "Attention"},
+            )
+
+        store = open_store()
+        self.assertEqual(store.ingest(self.path), 6)
+        self.assertEqual(len(store.graded), 8)
+        store.save()
+
+        store = open_store()
+        self.assertEqual(store.ingest(self.path), 0)
+        with open(self.path, "a") as f:
+            f.write("TRUE,150,8" + "," * 12 + "\n")
+        self.assertEqual(store.ingest(self.path), 1)
+        # respondents without a quiz are kept but never graded
+        self.assertEqual(len(store.respondents), 7)
+        self.assertEqual(len(store.graded), 8)
+
+        graded, removed = store.kept()
+        self.assertEqual(graded["respondent"].nunique(), 2)
+        self.assertEqual(removed["finished"], 0)
+        self.assertEqual(store.accumulator.cells, self.cells(graded))
+        store.save()
+
+        # a different answer key starts over
+        self.assertTrue(open_store(answer_key[1:13]).graded.empty)
+        self.assertEqual(len(open_store().graded), 8)
+
+    def test_response_store_exclusions(self):
+        answer_key = [answer for condition in PILOT_ANSWERS for answer in condition]
+        # keeps respondents no slower than the median, which a new export moves
+        rules = [
+            ExclusionRule(
+                "median duration",
+                lambda df: df["duration_float"] <= df["duration_float"].median(),
+            )
+        ]
+        store = HumanResponseStore(
+            os.path.join(self.directory.name, "store.pkl"),
+            answer_key[:12],
+            3,
+            lambda n: f"condition {n}",
+            {"Q112": "Attention"},
+            rules=rules,
+        )
+        store.ingest(self.path)
+        graded, _ = store.kept()
+        self.assertEqual(graded["duration"].unique().tolist(), [100])
+        self.assertEqual(store.accumulator.cells, self.cells(graded))
+
+        with open(self.path, "a") as f:
+            f.write("TRUE,10,8,Z" + "," * 11 + "\n")
+        store.ingest(self.path)
+        graded, _ = store.kept()
+        self.assertEqual(graded["duration"].unique().tolist(), [10])
+        self.assertEqual(store.accumulator.cells, self.cells(graded))
+
+    def test_response_store_layout(self):
+        answer_key = [answer for condition in PILOT_ANSWERS for answer in condition]
+
+        def open_store(question_columns):
+            return HumanResponseStore(
+                os.path.join(self.directory.name, "store.pkl"),
+                answer_key[:9],
+                3,
+                lambda n: f"condition {n}",
+                {"Q112": "Attention"},
+                question_columns=question_columns,
+            )
+
+        # quizzes of 3 questions, without Q7
+        store = open_store(QUESTION_COLUMNS[:3])
+        store.ingest(self.path)
+        self.assertEqual(len(store.graded), 6)
+        self.assertEqual(
+            store.graded["answer"].tolist(),
+            [answer_key[i][0] for i in [6, 7, 8, 3, 4, 5]],
+        )
+        graded, _ = store.kept()
+        self.assertEqual(store.accumulator.cells, self.cells(graded, 3))
+        store.save()
+        self.assertEqual(len(open_store(QUESTION_COLUMNS[:3]).graded), 6)
+        self.assertTrue(open_store(QUESTION_COLUMNS[1:]).graded.empty)
+
+    def cells(self, graded: pd.DataFrame, questions_per_quiz: int = 4) -> dict:
+        accumulator = ScoreAccumulator()
+        accumulator.add_many(
+            "human",
+            questions_per_quiz * graded["quiz_number"] + graded["question_num"] - 1,
+            graded["score"],
+        )
+        return accumulator.cells
+
+
+class TestExclusions(unittest.TestCase):
+    def setUp(self):
+        self.human_df = pd.DataFrame(
+            {
+                "duration_float": [10, 11, 12, 13, 14, 100, np.nan, 12],
+                "Attention": ["8", "8", "3", "8", "8", "8", "8", "8"],
+                "Finished": ["TRUE"] * 7 + ["FALSE"],
+            }
+        )
+
+    def test_matches_separate_passes(self):
+        mean = self.human_df["duration_float"].mean()
+        std = self.human_df["duration_float"].std()
+        expected = self.human_df[self.human_df["duration_float"] - mean <= 2 * std]
+        expected = expected[mean - expected["duration_float"] <= 2 * std]
+        expected = expected[expected["Attention"] == "8"]
+        expected = expected[expected["Finished"] == "TRUE"]
+
+        mask, removed = exclusion_mask(self.human_df)
+        self.assertEqual(self.human_df.index[mask].tolist(), expected.index.tolist())
+        self.assertEqual(
+            removed,
+            {"duration within 2 SD": 2, "Attention == '8'": 1, "finished": 1},
+        )
+
+    def test_configurable(self):
+        rules = [duration_rule(num_stds=1), attention_rule("3")]
+        mask, removed = exclusion_mask(self.human_df, rules)
+        self.assertEqual(np.flatnonzero(mask).tolist(), [2])
+        self.assertEqual(list(removed.values()), [2, 5])
+
+        rules = [finished_rule(), ExclusionRule("fast", lambda df: df.index < 3)]
+        mask, removed = exclusion_mask(self.human_df, rules)
+        self.assertEqual(np.flatnonzero(mask).tolist(), [0, 1, 2])
+        self.assertEqual(removed, {"finished": 1, "fast": 4})
+
+        mask, removed = exclusion_mask(self.human_df, [])
+        self.assertTrue(mask.all())
+        self.assertEqual(removed, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
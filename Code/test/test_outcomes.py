@@ -0,0 +1,73 @@
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(1, "../LLM_Analogical_Reasoning")
+
+from Code.outcomes import OutcomeTensor
+
+
+class TestOutcomeTensor(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.grades = rng.random((3, 2, 4, 10)) < 0.6
+        self.valid = rng.random((3, 2, 4, 10)) < 0.9
+        self.tensor = OutcomeTensor(["a", "b", "c"], 2, 4, 10)
+        for i, subject in enumerate(self.tensor.subjects):
+            self.tensor.set(subject, self.grades[i], self.valid[i])
+
+    def test_round_trip(self):
+        outcomes, valid = self.tensor.outcomes()
+        self.assertTrue(np.array_equal(valid, self.valid))
+        self.assertTrue(np.array_equal(outcomes, self.grades & self.valid))
+        self.assertEqual(self.tensor.bits.nbytes, 3 * 2 * 4 * 2)
+
+    def test_reductions(self):
+        correct = self.grades & self.valid
+        for keep, axes in [
+            ((), (0, 1, 2, 3)),
+            (("subject",), (1, 2, 3)),
+            (("quiz", "question"), (0, 3)),
+            (("subject", "sample"), (1, 2)),
+        ]:
+            expected = correct.sum(axis=axes) / self.valid.sum(axis=axes)
+            np.testing.assert_allclose(self.tensor.accuracy(keep), expected)
+        np.testing.assert_allclose(
+            self.tensor.question_means("b"),
+            (correct[1].sum(axis=-1) / self.valid[1].sum(axis=-1)).reshape(-1),
+        )
+        with self.assertRaises(ValueError):
+            self.tensor.counts(("condition",))
+
+    def test_select(self):
+        selected = self.tensor.select(["c", "a"], quizzes=slice(1, 2))
+        self.assertEqual(selected.shape, (2, 1, 4, 10))
+        correct, total = selected.counts(("subject",))
+        self.assertEqual(correct[0], (self.grades & self.valid)[2, 1].sum())
+        self.assertEqual(total[1], self.valid[0, 1].sum())
+
+    def test_error_overlap(self):
+        errors = (self.valid & ~self.grades).reshape(3, -1).astype(int)
+        self.assertTrue(np.array_equal(self.tensor.error_overlap(), errors @ errors.T))
+
+    def test_from_frame(self):
+        df = pd.DataFrame(
+            {
+                "subject_type": ["gpt"] * 4 + ["human"] * 3,
+                "quiz_number": [0, 0, 1, 1, 0, 0, np.nan],
+                "question_num": [1, 1, 2, 2, 1, 1, 1],
+                "respondent_scores": [1, 0, 1, 1, 1, np.nan, 1],
+            }
+        )
+        tensor = OutcomeTensor.from_frame(df)
+        self.assertEqual(tensor.subjects, ["gpt", "human"])
+        self.assertEqual(tensor.shape, (2, 2, 2, 2))
+        correct, total = tensor.counts(("subject",))
+        self.assertEqual(correct.tolist(), [3, 1])
+        self.assertEqual(total.tolist(), [4, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(1, "../LLM_Analogical_Reasoning")
+
+from Code.slurm_logs import find_slurm_logs, parse_slurm_log, parse_time, run_table
+
+LOG = """## SLURM PROLOG ###############################################################
+##    Job ID : 1007918
+##  Job Name : phase-1-pythia-12b-deduped
+##  Nodelist : gpu2110
+##      CPUs : 4
+##  Mem/Node : 122880 MB
+## Directory : /home/user/model_serving/Pythia
+##   Job Started : Fri Mar  8 05:16:11 PM EST 2024
+###############################################################################
+Modules Loaded
+
+Currently Loaded Modules:
+  1) python/3.9.16s-x3wdtvt   3) cudnn/8.7.0.84-11.8-lg2dpd5
+  2) cuda/11.8.0-lpttyok      4) gcc/10.1.0-mojgbnp
+
+START
+Loading checkpoint shards:   0%|          | 0/3 [00:00<?, ?it/s]\rLoading checkpoint shards: 100%|##########| 3/3 [03:08<00:00, 57.06s/it]
+Loading defaults1
+
+About to prompt model (5 times) with:
+
+Question 1:
+dog => Q Z I
+
+--------- SAMPLED RESPONSE SET ---------
+Q Z I
+----------------------------------------
+
+About to prompt model (3 times) with:
+
+Question 2:
+dog => Q Z I
+
+--------- SAMPLED RESPONSE SET ---------
+Q Z I
+----------------------------------------
+## SLURM EPILOG ###############################################################
+##     Job Ended : Fri Mar  8 06:16:11 PM EST 2024
+"""
+
+
+class TestSlurmLogs(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        run_directory = os.path.join(self.directory.name, "Phase_1", "Pythia")
+        os.makedirs(run_directory)
+        self.path = os.path.join(run_directory, "slurm-1007918.out")
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(LOG)
+        with open(os.path.join(run_directory, "12b-deduped_results.txt"), "w") as f:
+            f.write("")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_parse_time(self):
+        self.assertEqual(
+            parse_time("Wed Mar 13 03:09:37 PM EDT 2024"),
+            pd.Timestamp("2024-03-13 19:09:37", tz="UTC"),
+        )
+        self.assertTrue(pd.isna(parse_time("yesterday")))
+
+    def test_parse_slurm_log(self):
+        run = parse_slurm_log(self.path)
+        self.assertEqual(run["job_id"], 1007918)
+        self.assertEqual(run["node"], "gpu2110")
+        self.assertEqual((run["cpus"], run["memory_mb"]), (4, 122880))
+        self.assertEqual(
+            run["modules"],
+            [
+                "python/3.9.16s-x3wdtvt",
+                "cuda/11.8.0-lpttyok",
+                "cudnn/8.7.0.84-11.8-lg2dpd5",
+                "gcc/10.1.0-mojgbnp",
+            ],
+        )
+        self.assertEqual(run["quizzes_loaded"], 1)
+        self.assertEqual((run["prompts"], run["samples"]), (2, 8))
+        self.assertEqual(run["model_load_seconds"], 188)
+        self.assertEqual(run["end_time"] - run["start_time"], pd.Timedelta(hours=1))
+
+    def test_run_table(self):
+        results = pd.DataFrame(
+            {"phase": [1, 2], "model": ["12b-deduped"] * 2, "accuracy": [0.2, 0.1]}
+        )
+        table = run_table(
+            find_slurm_logs(self.directory.name), results, on=["phase", "model"]
+        )
+        self.assertEqual(len(table), 1)
+        row = table.iloc[0]
+        self.assertEqual((row["phase"], row["model"]), (1, "12b-deduped"))
+        self.assertEqual(row["elapsed_seconds"], 3600)
+        self.assertAlmostEqual(row["samples_per_second"], 8 / 3600)
+        self.assertEqual(row["accuracy"], 0.2)
+
+        no_epilog = self.path.replace("1007918", "1007919")
+        with open(no_epilog, "w", encoding="utf-8") as f:
+            f.write(LOG.split("## SLURM EPILOG")[0])
+        table = run_table([no_epilog])
+        self.assertTrue(np.isnan(table["samples_per_second"][0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
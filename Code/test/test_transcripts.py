@@ -0,0 +1,112 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(1, "../LLM_Analogical_Reasoning")
+
+from Code.transcripts import (
+    load_transcript,
+    read_responses,
+    stream_transcript,
+    write_atomically,
+)
+
+TRANSCRIPT = """Loading defaults1
+
+About to prompt model (2 times) with:
+
+Question 1:
+square => E K C
+oval => 
+
+--------- SAMPLED RESPONSE SET ---------
+C % K % E
+----------------------------------------
+
+C K E
+
+more
+----------------------------------------
+
+About to prompt model (2 times) with:
+
+Question 1:
+king => C C C
+woman => 
+
+--------- SAMPLED RESPONSE SET ---------
+c c
+----------------------------------------
+c c
+----------------------------------------
+printing all_responses
+['C % K % E', '\\nC K E\\n\\nmore', 'c c', 'c c']
+"""
+
+
+class TestTranscripts(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "results.txt")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, text: str):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def test_stream(self):
+        self.write(TRANSCRIPT)
+        records = list(stream_transcript(self.path))
+        self.assertEqual(
+            [(i, r) for _, i, r in records],
+            [(0, "C % K % E"), (1, "\nC K E\n\nmore"), (0, "c c"), (1, "c c")],
+        )
+        self.assertEqual(records[0][0], "Question 1:\nsquare => E K C\noval => ")
+        self.assertEqual(records[2][0], "Question 1:\nking => C C C\nwoman => ")
+
+    def test_truncated(self):
+        self.write(TRANSCRIPT[: TRANSCRIPT.index("c c\n---") + len("c c\n---")])
+        self.assertEqual(read_responses([self.path]), ["C % K % E", "\nC K E\n\nmore"])
+        self.write(TRANSCRIPT[: TRANSCRIPT.index("c c\n---") + len("c c\n") + 41])
+        self.assertEqual(
+            read_responses([self.path]), ["C % K % E", "\nC K E\n\nmore", "c c"]
+        )
+
+    def test_load_transcript(self):
+        self.write(TRANSCRIPT)
+        df = load_transcript(self.path, model="test")
+        self.assertEqual(df["quiz"].tolist(), [0, 0, 1, 1])
+        self.assertEqual(df["question"].tolist(), [0, 0, 0, 0])
+        self.assertEqual(df["sample"].tolist(), [0, 1, 0, 1])
+        self.assertEqual(df["response"].tolist(), read_responses([self.path], False))
+        self.assertEqual(set(df["model"]), {"test"})
+        self.assertTrue(os.path.exists(self.path + ".cache.npz"))
+        self.assertEqual(
+            load_transcript(self.path)["response"].tolist(), df["response"].tolist()
+        )
+
+        self.write(TRANSCRIPT.replace("c c", "C C"))
+        self.assertEqual(
+            load_transcript(self.path)["response"].tolist()[2:], ["C C", "C C"]
+        )
+
+    def test_write_atomically(self):
+        target = os.path.join(self.directory.name, "target")
+        write_atomically(target, lambda f: f.write(b"done"))
+
+        def fail(f):
+            f.write(b"partial")
+            raise OSError("disk full")
+
+        with self.assertRaises(OSError):
+            write_atomically(target, fail)
+        with open(target, "rb") as f:
+            self.assertEqual(f.read(), b"done")
+        self.assertEqual(os.listdir(self.directory.name), ["target"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+import hashlib
+import os
+import re
+from collections.abc import Iterator
+
+import numpy as np
+import pandas as pd
+
+PROMPT_HEADER = re.compile(r"About to prompt model \((\d+) times\) with:")
+RESPONSE_SET_HEADER = "--------- SAMPLED RESPONSE SET ---------"
+RESPONSE_SEPARATOR = "-" * 40
+ALL_RESPONSES_HEADER = "printing all_responses"
+QUESTION_HEADER = re.compile(r"^Question (\d+):$", re.MULTILINE)
+CACHE_SUFFIX = ".cache.npz"
+
+
+def stream_transcript(path: str) -> Iterator[tuple[str, int, str]]:
+    """
+    Walks the prompt blocks of a *_results.txt transcript line by line and yields
+    (prompt, sample_index, response) for every completed sample, so memory use does
+    not depend on the size of the transcript. Reading stops at the final dump of
+    all responses; a transcript cut off mid-run yields every sample completed
+    before the cut.
+    """
+    prompt_lines: list[str] | None = None
+    response_lines: list[str] | None = None
+    prompt = ""
+    samples = sample_index = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if response_lines is not None:
+                if line != RESPONSE_SEPARATOR:
+                    response_lines.append(line)
+                    continue
+                yield prompt, sample_index, "\n".join(response_lines)
+                sample_index += 1
+                response_lines = [] if sample_index < samples else None
+            elif prompt_lines is not None:
+                if line != RESPONSE_SET_HEADER:
+                    prompt_lines.append(line)
+                    continue
+                # the prompt is printed between two blank lines
+                prompt = "\n".join(prompt_lines[1:-1])
+                prompt_lines, response_lines = None, [] if samples else None
+            elif match := PROMPT_HEADER.fullmatch(line):
+                samples, sample_index = int(match.group(1)), 0
+                prompt_lines = []
+            elif line == ALL_RESPONSES_HEADER:
+                return
+
+
+def transcript_columns(path: str) -> dict[str, np.ndarray]:
+    """
+    Parses a transcript into quiz, question, sample and response columns. Quiz
+    and question numbers (from 0) are read off the last "Question N:" header of
+    each prompt, with a new quiz starting whenever the question number drops.
+    Responses are stored as concatenated UTF-8 bytes plus offsets.
+    """
+    quizzes, questions, samples = [], [], []
+    data = bytearray()
+    offsets = [0]
+    quiz, question = 0, -1
+    for prompt, sample_index, response in stream_transcript(path):
+        if sample_index == 0:
+            headers = QUESTION_HEADER.findall(prompt)
+            next_question = int(headers[-1]) - 1 if headers else question + 1
+            if question >= 0 and next_question <= question:
+                quiz += 1
+            question = next_question
+        quizzes.append(quiz)
+        questions.append(question)
+        samples.append(sample_index)
+        data += response.encode("utf-8")
+        offsets.append(len(data))
+    return {
+        "quiz": np.array(quizzes, dtype=np.int32),
+        "question": np.array(questions, dtype=np.int32),
+        "sample": np.array(samples, dtype=np.int32),
+        "response_data": np.frombuffer(bytes(data), dtype=np.uint8),
+        "response_offsets": np.array(offsets, dtype=np.int64),
+    }
+
+
+def file_signature(path: str, content_hash: bool = False) -> dict[str, np.ndarray]:
+    """
+    Returns the size and modification time of a file and, if content_hash,
+    the sha256 of its contents.
+    """
+    stat = os.stat(path)
+    signature = {
+        "source_size": np.int64(stat.st_size),
+        "source_mtime": np.int64(stat.st_mtime_ns),
+    }
+    if content_hash:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        signature["source_hash"] = np.array(digest.hexdigest())
+    return signature
+
+
+def write_atomically(path: str, write) -> None:
+    """
+    Calls write with a binary file and moves the result to path once complete,
+    so concurrent readers never see a partial file. The temporary file is
+    removed if writing fails, and the error is raised again.
+    """
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_path, "wb") as f:
+            write(f)
+        os.replace(temporary_path, path)
+    except BaseException:
+        try:
+            os.remove(temporary_path)
+        except OSError:
+            pass
+        raise
+
+
+def load_transcript(
+    path: str,
+    model: str | None = None,
+    cache_path: str | None = None,
+    verify_hash: bool = False,
+) -> pd.DataFrame:
+    """
+    Returns a DataFrame with model, quiz, question, sample and response columns
+    for the transcript at path. The parsed columns are kept in an .npz file next
+    to the transcript (or at cache_path) and reused until the transcript's size
+    or modification time changes, or, if verify_hash, its contents change.
+    """
+    cache_path = cache_path or path + CACHE_SUFFIX
+    model = model or os.path.basename(path).split("_results")[0]
+    signature = file_signature(path)
+
+    columns = None
+    if os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as cached:
+                columns = dict(cached)
+        except (OSError, ValueError, EOFError):
+            columns = {}
+        stale = any(k not in columns or columns[k] != v for k, v in signature.items())
+        if verify_hash and not stale:
+            stale = columns["source_hash"] != file_signature(path, True)["source_hash"]
+        if stale or not columns:
+            columns = None
+
+    if columns is None:
+        columns = transcript_columns(path) | file_signature(path, True)
+        try:
+            write_atomically(cache_path, lambda f: np.savez(f, **columns))
+        except OSError:
+            pass  # the cache is optional, e.g. for read-only data directories
+
+    data, offsets = columns["response_data"].tobytes(), columns["response_offsets"]
+    responses = [
+        data[start:end].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])
+    ]
+    return pd.DataFrame(
+        {
+            "model": pd.Categorical([model] * len(responses)),
+            "quiz": columns["quiz"],
+            "question": columns["question"],
+            "sample": columns["sample"],
+            "response": responses,
+        }
+    )
+
+
+def read_responses(paths: list[str], cached: bool = True) -> list[str]:
+    """
+    Returns every sampled response in the transcripts at paths, in order,
+    going through the columnar cache of load_transcript unless cached is False.
+    """
+    if cached:
+        return [r for path in paths for r in load_transcript(path)["response"]]
+    return [response for path in paths for _, _, response in stream_transcript(path)]